@@ -0,0 +1,216 @@
+import argparse
+import multiprocessing
+import time
+
+from typing import Iterator, List, NamedTuple, Optional
+
+from chess import ChessGame, starting_fenstring
+from pgn import PgnGame, format_pgn, game_result, move_san, parse_san, read_pgn
+from search import Searcher, TranspositionTable, mate_score
+
+# Centipawns a move may lose before it is flagged, with its NAG, worst first
+move_flags = [(300, '$4'),  # Blunder, ??
+              (100, '$2'),  # Mistake, ?
+              (50, '$6')]   # Inaccuracy, ?!
+
+score_cap = 2000  # Mate scores count as this many centipawns when flagging
+
+
+class AnalysisTask(NamedTuple):
+    """
+    One game to analyse and the search limits of every position
+    """
+
+    record: PgnGame
+    depth: Optional[int]
+    nodes: Optional[int]
+    hash_size: int
+
+
+class AnalysedGame(NamedTuple):
+    """
+    Annotated PGN text of a game sent back by a worker process, with how
+    many moves were flagged
+    """
+
+    pgn: str
+    flags: List[int]  # Count of each of move_flags, in the same order
+    positions: int
+    error: str  # Why the game could not be replayed, '' if it was
+
+
+def format_eval(score: int, color: int) -> str:
+    """
+    Returns a score of the side to move as a [%eval] value from the point
+    of view of white, pawns like '0.35' or moves to mate like '#-3'
+    """
+
+    score *= color
+
+    if abs(score) >= mate_score - 1000:
+        moves = (mate_score - abs(score) + 1) // 2
+        return f'#{moves if score > 0 else -moves}'
+
+    return f'{score / 100:.2f}'
+
+def search_position(searcher: Searcher, game: ChessGame, depth: Optional[int],
+                    nodes: Optional[int]) -> tuple:
+    """
+    Returns the score of the side to move and the best move of the current
+    position, ending positions score by their result with no move
+    """
+
+    if game_result(game) != '*':
+        return (-mate_score if game.in_check(game.current_color) else 0), 0
+
+    result = searcher.search(depth or 64, node_limit=nodes)
+
+    return result.score, result.best_move
+
+def analyse_game(task: AnalysisTask) -> AnalysedGame:
+    """
+    Searches every position of a game and annotates its moves, runs in a
+    worker process
+
+    One transposition table is kept for the whole game, what was found in a
+    position mostly carries over to the next
+    """
+
+    record = task.record
+    headers = dict(record.headers)
+    headers['Annotator'] = ('Chess-py ' + (f'depth {task.depth}' if task.depth
+                                           else f'{task.nodes} nodes'))
+
+    fenstring = record.headers.get('FEN')
+
+    game = ChessGame('bitboard')
+    game.load_fenstring(fenstring or starting_fenstring, gen_moves=False)
+
+    searcher = Searcher(game, TranspositionTable(task.hash_size))
+
+    flags = [0] * len(move_flags)
+    annotations = []
+
+    score, best_move = search_position(searcher, game, task.depth, task.nodes)
+
+    for ply, san in enumerate(record.moves):
+        try:
+            move = parse_san(game, san)
+        except ValueError as error:
+            return AnalysedGame(format_pgn(record.headers, record.moves,
+                                           record.result, fenstring),
+                                flags, ply, f'Ply {ply + 1}: {error}')
+
+        best_san = move_san(game, best_move) if best_move else ''
+        color = game.current_color
+
+        game.make_move(move)
+
+        next_score, next_best_move = search_position(searcher, game,
+                                                     task.depth, task.nodes)
+
+        # What the move played gave up against the best move found, the
+        # next position is scored for the other side
+        loss = (min(max(score, -score_cap), score_cap)
+                + min(max(next_score, -score_cap), score_cap))
+
+        annotation = ''
+
+        for i, (threshold, nag) in enumerate(move_flags):
+            if loss >= threshold and move != best_move:
+                flags[i] += 1
+                annotation = nag + ' '
+                break
+
+        comments = []
+
+        # A mated or stalemated position has no evaluation to give
+        if next_best_move or game_result(game) == '*':
+            comments.append(f'[%eval {format_eval(next_score, -color)}]')
+        if best_san and move != best_move:
+            comments.append(f'Best: {best_san}')
+
+        annotations.append(annotation + ('{' + ' '.join(comments) + '}'
+                                         if comments else ''))
+
+        score, best_move = next_score, next_best_move
+
+    return AnalysedGame(format_pgn(headers, record.moves, record.result,
+                                   fenstring, annotations),
+                        flags, len(record.moves), '')
+
+def analysis_tasks(paths: List[str], depth: Optional[int],
+                   nodes: Optional[int],
+                   hash_size: int) -> Iterator[AnalysisTask]:
+    """
+    Yields a task for every game of the PGN files, read one game at a time
+    """
+
+    for path in paths:
+        for record in read_pgn(path):
+            yield AnalysisTask(record, depth, nodes, hash_size)
+
+def run_analysis(paths: List[str], output_path: str, depth: int=None,
+                 nodes: int=None, processes: int=None,
+                 hash_size: int=1 << 18) -> int:
+    """
+    Analyses every game of PGN files over a process pool, writing the
+    annotated games to output_path in their original order. Returns the
+    number of games written
+    """
+
+    if depth is None and nodes is None:
+        raise ValueError('A depth or node budget is needed')
+
+    start = time.perf_counter()
+    games = positions = 0
+    totals = [0] * len(move_flags)
+
+    context = multiprocessing.get_context()
+
+    with context.Pool(processes) as pool, \
+            open(output_path, 'w', encoding='utf-8') as output:
+        for analysed in pool.imap(analyse_game,
+                                  analysis_tasks(paths, depth, nodes,
+                                                 hash_size)):
+            output.write(analysed.pgn)
+
+            games += 1
+            positions += analysed.positions
+            totals = [total + count
+                      for total, count in zip(totals, analysed.flags)]
+
+            if analysed.error:
+                print(f'Game {games} left unannotated, {analysed.error}')
+
+    elapsed = time.perf_counter() - start
+    blunders, mistakes, inaccuracies = totals
+
+    print(f'{games} games, {positions} positions in {elapsed:.1f}s: '
+          f'{blunders} blunders, {mistakes} mistakes, {inaccuracies} '
+          'inaccuracies')
+
+    return games
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotates every move of '
+                                     'PGN games with engine evaluations, '
+                                     'best moves and blunder flags')
+    parser.add_argument('pgn', nargs='+', help='PGN files to analyse')
+    parser.add_argument('--output', required=True,
+                        help='file the annotated games are written to')
+    parser.add_argument('--depth', type=int, default=None)
+    parser.add_argument('--nodes', type=int, default=None,
+                        help='node budget of each position instead of a depth')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, one per core by default')
+    parser.add_argument('--hash-size', type=int, default=1 << 18,
+                        help='transposition table entries of each game')
+    args = parser.parse_args()
+
+    if args.depth is None and args.nodes is None:
+        args.depth = 4
+
+    run_analysis(args.pgn, args.output, args.depth, args.nodes,
+                 args.processes, args.hash_size)
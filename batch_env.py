@@ -0,0 +1,123 @@
+import numpy as np
+
+from typing import Tuple
+
+from chess import ChessGame, starting_fenstring
+from bitboard import PAWN, QUEEN, encode_move
+
+action_count = 64 * 64  # Actions are initial_pos * 64 + final_pos
+
+
+class BatchChessEnv:
+    """
+    Runs a batch of games in lockstep for reinforcement learning
+
+    Positions are exposed as stacked NumPy arrays, observations are (N, 12,
+    8, 8) uint8 piece planes indexed by piece index (color * 6 + piece type),
+    row and file, and legal action masks are (N, 4096) bools. Actions are
+    initial_pos * 64 + final_pos, pawns reaching the last row become queens
+
+    Games that end are reset to the starting position straight away, the
+    step they ended on is marked in dones. Besides mate and stalemate they
+    are drawn by threefold repetition, the fifty-move rule, insufficient
+    material or reaching max_plies
+    """
+
+    num_envs: int
+    max_plies: int  # Games reaching this many plies are ended as a draw
+
+    games: list  # One ChessGame using the bitboard backend per environment
+
+    observations: np.ndarray  # (N, 12, 8, 8) uint8 piece planes
+    masks: np.ndarray  # (N, 4096) bool legal actions
+    to_play: np.ndarray  # (N, ) int8 color_val of the side to move
+
+    def __init__(self, num_envs: int, max_plies: int=512,
+                 fenstring: str=starting_fenstring) -> None:
+        """
+        Constructor for the BatchChessEnv class
+
+        fenstring:str -> position every game starts and is reset to
+        """
+
+        self.num_envs = num_envs
+        self.max_plies = max_plies
+        self.fenstring = fenstring
+
+        self.observations = np.zeros((num_envs, 12, 8, 8), dtype=np.uint8)
+        self.masks = np.zeros((num_envs, action_count), dtype=bool)
+        self.to_play = np.ones(num_envs, dtype=np.int8)
+
+        # Each game writes its planes and legal moves straight into its row
+        # of the batch arrays
+        self.games = []
+        for i in range(num_envs):
+            game = ChessGame('bitboard')
+            game.attach_observations(self.observations[i],
+                                     self.masks[i].reshape(64, 64))
+            self.games.append(game)
+
+    def reset(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resets every game, returns the observations and legal action masks
+        """
+
+        for i, game in enumerate(self.games):
+            game.load_fenstring(self.fenstring, gen_moves=False)
+            self.to_play[i] = game.current_color
+
+        return self.observations, self.masks
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                                 np.ndarray, np.ndarray]:
+        """
+        Plays one action in every game
+
+        Returns observations, legal action masks, rewards and dones. Rewards
+        are from the point of view of the side that just moved: 1 for giving
+        mate, 0 otherwise
+        """
+
+        actions = np.asarray(actions, dtype=np.int64)
+
+        if actions.shape != (self.num_envs, ):
+            raise ValueError(f'Expected {self.num_envs} actions, got shape '
+                             f'{actions.shape}')
+
+        illegal = ~self.masks[np.arange(self.num_envs), actions]
+        if illegal.any():
+            raise ValueError('Illegal actions in environments '
+                             f'{np.flatnonzero(illegal).tolist()}')
+
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        for i, (game, action) in enumerate(zip(self.games, actions.tolist())):
+            initial_pos, final_pos = divmod(action, 64)
+            promotion = 0
+
+            if (game.position.mailbox[initial_pos] % 6 == PAWN
+                    and final_pos // 8 in (0, 7)):
+                promotion = QUEEN
+
+            game.make_move(encode_move(initial_pos, final_pos, promotion))
+
+            legal_moves = game.legal_moves()
+
+            if not legal_moves:
+                dones[i] = True
+                if game.in_check(game.current_color):
+                    rewards[i] = 1.0
+            elif (game.is_repetition(2) or game.halfmove_clock >= 100
+                  or game.is_insufficient_material()
+                  or len(game.history) >= self.max_plies):
+                dones[i] = True
+
+            if dones[i]:
+                game.load_fenstring(self.fenstring, gen_moves=False)
+            else:
+                game.update_move_mask(legal_moves)
+
+            self.to_play[i] = game.current_color
+
+        return self.observations, self.masks, rewards, dones
@@ -0,0 +1,837 @@
+from typing import Dict, List, Optional
+
+# Piece types, a piece index is color * 6 + piece type
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# Color indexes, used instead of the -1 / 1 color_val of the Piece classes
+WHITE, BLACK = 0, 1
+
+# Castling rights bits
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+
+# Kinds of moves gen_moves can be limited to. Captures include en passant
+# and promotions that capture, promotions are the pushes onto the last row
+CAPTURE_MOVES, PROMOTION_MOVES, QUIET_MOVES = 1, 2, 4
+ALL_MOVES = CAPTURE_MOVES | PROMOTION_MOVES | QUIET_MOVES
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+# Squares are numbered the same way as ChessGame.board, 0 being the top left
+# (a8) tile and 63 the bottom right (h1) tile. Bit n is set if square n is
+# occupied
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+ROWS = [0xFF << (8 * row) for row in range(8)]
+
+BIT = [1 << pos for pos in range(64)]
+
+
+def encode_move(initial_pos: int, final_pos: int, promotion: int=0) -> int:
+    """
+    Packs a move into a single int, promotion is the piece type a pawn is
+    promoted to (0 if the move is not a promotion)
+    """
+
+    return initial_pos | (final_pos << 6) | (promotion << 12)
+
+def move_from(move: int) -> int:
+    """
+    Returns the square a move starts on
+    """
+
+    return move & 63
+
+def move_to(move: int) -> int:
+    """
+    Returns the square a move ends on
+    """
+
+    return (move >> 6) & 63
+
+def move_promotion(move: int) -> int:
+    """
+    Returns the piece type a move promotes to, 0 if it is not a promotion
+    """
+
+    return move >> 12
+
+def color_index(color_val: int) -> int:
+    """
+    Converts a Piece.color_val (1 White, -1 Black) into WHITE or BLACK
+    """
+
+    return WHITE if color_val == 1 else BLACK
+
+def iter_bits(bitboard: int) -> List[int]:
+    """
+    Returns the position of every set bit in a bitboard
+    """
+
+    squares = []
+
+    while bitboard:
+        low_bit = bitboard & -bitboard
+        squares.append(low_bit.bit_length() - 1)
+        bitboard ^= low_bit
+
+    return squares
+
+
+def _leaper_attacks(offsets: List[tuple]) -> List[int]:
+    """
+    Builds a table of attacked squares for a piece jumping by fixed
+    (row, file) offsets
+    """
+
+    table = []
+
+    for pos in range(64):
+        row, file = pos >> 3, pos & 7
+        attacks = 0
+
+        for row_offset, file_offset in offsets:
+            next_row, next_file = row + row_offset, file + file_offset
+
+            if 0 <= next_row <= 7 and 0 <= next_file <= 7:
+                attacks |= BIT[next_row * 8 + next_file]
+
+        table.append(attacks)
+
+    return table
+
+KNIGHT_ATTACKS = _leaper_attacks([(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                                  (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _leaper_attacks([(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                                (0, 1), (1, -1), (1, 0), (1, 1)])
+
+# Squares attacked by a pawn of each color standing on a square. White pawns
+# move towards row 0
+PAWN_ATTACKS = [_leaper_attacks([(-1, -1), (-1, 1)]),
+                _leaper_attacks([(1, -1), (1, 1)])]
+
+
+def _ray(pos: int, row_offset: int, file_offset: int) -> List[int]:
+    """
+    Returns the squares from a position (exclusive) to the edge of the board
+    in one direction
+    """
+
+    squares = []
+    row, file = (pos >> 3) + row_offset, (pos & 7) + file_offset
+
+    while 0 <= row <= 7 and 0 <= file <= 7:
+        squares.append(row * 8 + file)
+        row, file = row + row_offset, file + file_offset
+
+    return squares
+
+def _line_table(pos: int, direction: tuple) -> Dict[int, int]:
+    """
+    Maps every arrangement of blockers on a line through a position (two
+    opposite rays) to the squares a slider on that line attacks
+    """
+
+    rays = [_ray(pos, *direction), _ray(pos, -direction[0], -direction[1])]
+
+    # The last square of a ray never changes what is attacked so it is left
+    # out of the blocker mask
+    mask = 0
+    for ray in rays:
+        for square in ray[:-1]:
+            mask |= BIT[square]
+
+    table = {}
+    blockers = 0
+
+    # Carry-Rippler trick, enumerates every subset of the mask
+    while True:
+        attacks = 0
+
+        for ray in rays:
+            for square in ray:
+                attacks |= BIT[square]
+
+                if blockers & BIT[square]:
+                    break
+
+        table[blockers] = attacks
+
+        blockers = (blockers - mask) & mask
+        if blockers == 0:
+            break
+
+    return table
+
+def _slider_tables(directions: List[tuple]) -> tuple:
+    """
+    Builds the blocker masks and attack lookup tables of a sliding piece that
+    moves along two lines
+    """
+
+    masks = []
+    tables = []
+
+    for pos in range(64):
+        first, second = (_line_table(pos, direction)
+                         for direction in directions)
+
+        # max() of a line table is its full blocker mask since every other
+        # key is a subset of it
+        masks.append(max(first) | max(second))
+
+        # Both lines are independent so the table for the whole piece is
+        # every combination of the two
+        table = {}
+        for first_blockers, first_attacks in first.items():
+            for second_blockers, second_attacks in second.items():
+                table[first_blockers | second_blockers] = (first_attacks
+                                                           | second_attacks)
+
+        tables.append(table)
+
+    return masks, tables
+
+ROOK_MASKS, ROOK_TABLES = _slider_tables([(1, 0), (0, 1)])
+BISHOP_MASKS, BISHOP_TABLES = _slider_tables([(1, 1), (1, -1)])
+
+
+def _between_table() -> List[List[int]]:
+    """
+    Builds the squares strictly between every two squares on a shared row,
+    file or diagonal, 0 for squares that share none
+    """
+
+    table = [[0] * 64 for pos in range(64)]
+
+    for pos in range(64):
+        for direction in [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1),
+                          (1, -1), (1, 0), (1, 1)]:
+            between = 0
+
+            for square in _ray(pos, *direction):
+                table[pos][square] = between
+                between |= BIT[square]
+
+    return table
+
+BETWEEN = _between_table()
+
+
+def rook_attacks(pos: int, occupied: int) -> int:
+    """
+    Returns the squares a rook on pos attacks given the occupied squares
+    """
+
+    return ROOK_TABLES[pos][occupied & ROOK_MASKS[pos]]
+
+def bishop_attacks(pos: int, occupied: int) -> int:
+    """
+    Returns the squares a bishop on pos attacks given the occupied squares
+    """
+
+    return BISHOP_TABLES[pos][occupied & BISHOP_MASKS[pos]]
+
+
+# Squares that have to be empty for each castle, and the king moves for them
+CASTLE_EMPTY = {CASTLE_WK: BIT[61] | BIT[62],
+                CASTLE_WQ: BIT[57] | BIT[58] | BIT[59],
+                CASTLE_BK: BIT[5] | BIT[6],
+                CASTLE_BQ: BIT[1] | BIT[2] | BIT[3]}
+CASTLE_MOVES = {CASTLE_WK: encode_move(60, 62), CASTLE_WQ: encode_move(60, 58),
+                CASTLE_BK: encode_move(4, 6), CASTLE_BQ: encode_move(4, 2)}
+
+# Squares the king crosses and lands on when castling to each square, none
+# of them may be attacked
+CASTLE_PATH = {62: (61, 62), 58: (59, 58), 6: (5, 6), 2: (3, 2)}
+
+# Rook move made alongside each castling king move
+CASTLE_ROOKS = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+# Castling rights kept after a piece moves from or to a square
+CASTLE_KEEP = [0xF] * 64
+CASTLE_KEEP[60] &= ~(CASTLE_WK | CASTLE_WQ)
+CASTLE_KEEP[63] &= ~CASTLE_WK
+CASTLE_KEEP[56] &= ~CASTLE_WQ
+CASTLE_KEEP[4] &= ~(CASTLE_BK | CASTLE_BQ)
+CASTLE_KEEP[7] &= ~CASTLE_BK
+CASTLE_KEEP[0] &= ~CASTLE_BQ
+
+
+def _pawn_move_rows(offset: int, promotion_row: int) -> List[List[tuple]]:
+    """
+    Builds the moves of pawns moving by offset, indexed by the row they end
+    on and the byte of that row holding their final positions
+    """
+
+    move_rows = []
+
+    for row in range(8):
+        promotions = PROMOTIONS if row == promotion_row else (0, )
+        table = []
+
+        for byte in range(256):
+            table.append(tuple(encode_move(row * 8 + file - offset,
+                                           row * 8 + file, promotion)
+                               for file in range(8) if byte & (1 << file)
+                               for promotion in promotions))
+
+        move_rows.append(table)
+
+    return move_rows
+
+# Piece types a pawn can be promoted to, best first
+PROMOTIONS = (QUEEN, KNIGHT, ROOK, BISHOP)
+
+# Moves of pawn pushes, double pushes and both captures for each color
+PAWN_MOVE_ROWS = [[_pawn_move_rows(offset, 0) for offset in (-8, -16, -9, -7)],
+                  [_pawn_move_rows(offset, 7) for offset in (8, 16, 7, 9)]]
+
+# Moves from each square to a set of target squares, filled in as targets are
+# seen so turning a bitboard into moves is a single lookup
+MOVE_LISTS: List[Dict[int, tuple]] = [{} for pos in range(64)]
+
+def _cache_move_list(initial_pos: int, targets: int) -> tuple:
+    """
+    Builds the moves from a square to every target square and stores them in
+    MOVE_LISTS
+    """
+
+    move_list = tuple(encode_move(initial_pos, final_pos)
+                      for final_pos in iter_bits(targets))
+    MOVE_LISTS[initial_pos][targets] = move_list
+
+    return move_list
+
+
+def castling_rights(board: List) -> int:
+    """
+    Returns the castling rights bits of a ChessGame.board, which come from
+    the can_castle flags of kings and rooks still on their starting squares
+    """
+
+    rights = 0
+
+    for right, king_pos, rook_pos, king, rook in [
+            (CASTLE_WK, 60, 63, KING, ROOK), (CASTLE_WQ, 60, 56, KING, ROOK),
+            (CASTLE_BK, 4, 7, KING + 6, ROOK + 6),
+            (CASTLE_BQ, 4, 0, KING + 6, ROOK + 6)]:
+        if (board[king_pos].index == king and board[rook_pos].index == rook
+                and board[king_pos].can_castle and board[rook_pos].can_castle):
+            rights |= right
+
+    return rights
+
+
+class BitboardPosition:
+    """
+    Chess position stored as twelve 64-bit bitboards, one for each piece type
+    of each color
+    """
+
+    pieces: List[int]  # Bitboard of every piece index (color * 6 + piece type)
+    occupancy: List[int]  # Bitboard of all pieces of each color
+
+    mailbox: List[int]  # Piece index on each square, -1 for empty squares
+
+    side: int  # Color index of the side to move
+    castling: int  # Castling rights bits
+    ep_square: int  # Square a pawn can capture en passant onto, -1 if none
+
+    history: List[tuple]  # Undo records of every move made, newest last
+
+    def __init__(self) -> None:
+        """
+        Constructor for the BitboardPosition class, creates an empty board
+        """
+
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        self.mailbox = [-1] * 64
+
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = -1
+
+        self.history = []
+
+    @classmethod
+    def from_pieces(cls, board: List, color_val: int,
+                    en_passant: int=-1) -> 'BitboardPosition':
+        """
+        Builds a position from a ChessGame.board list of Piece objects
+
+        color_val:int -> color of the side to move
+        en_passant:int -> square a pawn can capture en passant onto
+        """
+
+        position = cls()
+        position.side = color_index(color_val)
+        position.ep_square = en_passant
+
+        for piece in board:
+            if piece.color_val != 0:
+                position.put_piece(piece.pos, piece.index)
+
+        position.castling = castling_rights(board)
+
+        return position
+
+    def put_piece(self, pos: int, piece: int) -> None:
+        """
+        Places a piece index on an empty square
+        """
+
+        self.pieces[piece] |= BIT[pos]
+        self.occupancy[piece // 6] |= BIT[pos]
+        self.mailbox[pos] = piece
+
+    def remove_piece(self, pos: int) -> None:
+        """
+        Removes the piece standing on a square
+        """
+
+        piece = self.mailbox[pos]
+
+        self.pieces[piece] ^= BIT[pos]
+        self.occupancy[piece // 6] ^= BIT[pos]
+        self.mailbox[pos] = -1
+
+    def is_attacked(self, pos: int, color: int) -> bool:
+        """
+        Returns a bool if a square is attacked by any piece of a color index
+        """
+
+        pieces = self.pieces
+        base = color * 6
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+        return bool(KNIGHT_ATTACKS[pos] & pieces[base + KNIGHT]
+                    or KING_ATTACKS[pos] & pieces[base + KING]
+                    or PAWN_ATTACKS[color ^ 1][pos] & pieces[base + PAWN]
+                    or bishop_attacks(pos, occupied) & (pieces[base + BISHOP]
+                                                        | pieces[base + QUEEN])
+                    or rook_attacks(pos, occupied) & (pieces[base + ROOK]
+                                                      | pieces[base + QUEEN]))
+
+    def attackers(self, pos: int, color: int, occupied: int) -> int:
+        """
+        Returns a bitboard of the pieces of a color index attacking a square,
+        sliders only being blocked by the occupied squares given
+        """
+
+        pieces = self.pieces
+        base = color * 6
+
+        return (KNIGHT_ATTACKS[pos] & pieces[base + KNIGHT]
+                | KING_ATTACKS[pos] & pieces[base + KING]
+                | PAWN_ATTACKS[color ^ 1][pos] & pieces[base + PAWN]
+                | bishop_attacks(pos, occupied) & (pieces[base + BISHOP]
+                                                   | pieces[base + QUEEN])
+                | rook_attacks(pos, occupied) & (pieces[base + ROOK]
+                                                 | pieces[base + QUEEN]))
+
+    def pins(self, king_pos: int) -> Dict[int, int]:
+        """
+        Maps each piece of the side to move pinned to its king on king_pos to
+        the squares it can still move to, the line up to and including the
+        pinning piece
+        """
+
+        us = self.side
+        base = (us ^ 1) * 6
+        pieces = self.pieces
+        enemy = self.occupancy[us ^ 1]
+        occupied = self.occupancy[us] | enemy
+
+        # Enemy sliders that would attack the king through our pieces
+        snipers = (rook_attacks(king_pos, enemy) & (pieces[base + ROOK]
+                                                    | pieces[base + QUEEN])
+                   | bishop_attacks(king_pos, enemy) & (pieces[base + BISHOP]
+                                                        | pieces[base + QUEEN]))
+
+        pins = {}
+
+        while snipers:
+            low_bit = snipers & -snipers
+            snipers ^= low_bit
+
+            line = BETWEEN[king_pos][low_bit.bit_length() - 1]
+            blockers = line & occupied
+
+            # Exactly one piece in the way, and it is ours
+            if blockers and not blockers & (blockers - 1):
+                pins[blockers.bit_length() - 1] = line | low_bit
+
+        return pins
+
+    def is_pseudo_legal(self, move: int) -> bool:
+        """
+        Returns a bool if a move is one gen_moves would generate, without
+        generating any. Used for moves remembered from other positions, like
+        those of a transposition table
+        """
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+        promotion = move >> 12
+
+        us = self.side
+        piece = self.mailbox[initial_pos]
+
+        if piece == -1 or piece // 6 != us or BIT[final_pos] & self.occupancy[us]:
+            return False
+
+        piece_type = piece % 6
+        enemy = self.occupancy[us ^ 1]
+        occupied = self.occupancy[us] | enemy
+
+        if piece_type == PAWN:
+            forward = -8 if us == WHITE else 8
+
+            # Pawns reaching the last row have to promote, no others can
+            if final_pos >> 3 == (0 if us == WHITE else 7):
+                if promotion not in PROMOTIONS:
+                    return False
+            elif promotion:
+                return False
+
+            if final_pos == initial_pos + forward:
+                return not BIT[final_pos] & occupied
+            if final_pos == initial_pos + 2 * forward:
+                return (initial_pos >> 3 == (6 if us == WHITE else 1)
+                        and not (BIT[final_pos] | BIT[initial_pos + forward])
+                        & occupied)
+
+            return bool(BIT[final_pos] & PAWN_ATTACKS[us][initial_pos]
+                        and (BIT[final_pos] & enemy
+                             or final_pos == self.ep_square))
+
+        if promotion:
+            return False
+
+        if piece_type == KING and abs(final_pos - initial_pos) == 2:
+            return any(CASTLE_MOVES[castle] == move and self.castling & castle
+                       and not occupied & CASTLE_EMPTY[castle]
+                       for castle in (CASTLE_WK, CASTLE_WQ, CASTLE_BK,
+                                      CASTLE_BQ))
+
+        if piece_type == KNIGHT:
+            targets = KNIGHT_ATTACKS[initial_pos]
+        elif piece_type == KING:
+            targets = KING_ATTACKS[initial_pos]
+        elif piece_type == BISHOP:
+            targets = bishop_attacks(initial_pos, occupied)
+        elif piece_type == ROOK:
+            targets = rook_attacks(initial_pos, occupied)
+        else:
+            targets = (bishop_attacks(initial_pos, occupied)
+                       | rook_attacks(initial_pos, occupied))
+
+        return bool(BIT[final_pos] & targets)
+
+    def move_kind(self, move: int) -> int:
+        """
+        Returns which of CAPTURE_MOVES, PROMOTION_MOVES or QUIET_MOVES a
+        move of the side to move is, as gen_moves splits them
+        """
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+
+        if (self.mailbox[final_pos] != -1 or (final_pos == self.ep_square
+                                              and self.mailbox[initial_pos] % 6 == PAWN)):
+            return CAPTURE_MOVES
+        if move >> 12:
+            return PROMOTION_MOVES
+
+        return QUIET_MOVES
+
+    def check_state(self) -> Optional[tuple]:
+        """
+        Returns what legal_moves needs to know about the king of the side to
+        move, its square, the pieces checking it, the squares other pieces
+        may move to and the pin lines, or None when it has no king
+
+        Working this out once lets the moves of a position be filtered a
+        few at a time without finding checkers and pins again
+        """
+
+        us = self.side
+        king = self.pieces[us * 6 + KING]
+
+        if not king:
+            return None
+
+        king_pos = king.bit_length() - 1
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+        checkers = self.attackers(king_pos, us ^ 1, occupied)
+
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            check_mask = 0  # Double check, only the king can move
+        else:
+            check_mask = checkers | BETWEEN[king_pos][checkers.bit_length() - 1]
+
+        return king_pos, checkers, check_mask, self.pins(king_pos)
+
+    def legal_moves(self, moves: List[int]=None,
+                    state: tuple=None) -> List[int]:
+        """
+        Returns the legal moves of the side to move, from gen_moves or from
+        a given list of its pseudo-legal moves
+
+        Checkers and pins are found once, after which most moves are kept or
+        dropped with a couple of bit tests instead of being played. The king
+        may not step onto an attacked square, castle out of, through or into
+        check, other pieces have to capture or block a single checker and
+        pinned pieces stay on their pin line. En passant captures can uncover
+        a check along a row so they are played and tested
+
+        state:tuple -> check_state of the position if it is already known
+        """
+
+        if moves is None:
+            moves = self.gen_moves()
+
+        if state is None:
+            state = self.check_state()
+
+            if state is None:
+                return list(moves)
+
+        king_pos, checkers, check_mask, pins = state
+
+        them = self.side ^ 1
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        without_king = occupied ^ BIT[king_pos]
+
+        ep_square = self.ep_square
+        mailbox = self.mailbox
+
+        legal = []
+
+        for move in moves:
+            initial_pos = move & 63
+            final_pos = (move >> 6) & 63
+
+            if initial_pos == king_pos:
+                if abs(final_pos - initial_pos) == 2:
+                    if checkers or any(self.attackers(pos, them, occupied)
+                                       for pos in CASTLE_PATH[final_pos]):
+                        continue
+                elif self.attackers(final_pos, them, without_king):
+                    continue
+            elif final_pos == ep_square and mailbox[initial_pos] % 6 == PAWN:
+                self.make_move(move)
+                attacked = self.is_attacked(king_pos, them)
+                self.unmake_move()
+
+                if attacked:
+                    continue
+            elif not BIT[final_pos] & check_mask:
+                continue
+            elif initial_pos in pins and not BIT[final_pos] & pins[initial_pos]:
+                continue
+
+            legal.append(move)
+
+        return legal
+
+    def gen_moves(self, kinds: int=ALL_MOVES) -> List[int]:
+        """
+        Returns every pseudo-legal move of the side to move as encoded ints,
+        promotions are generated for every piece a pawn can become
+
+        kinds:int -> CAPTURE_MOVES, PROMOTION_MOVES and QUIET_MOVES bits of the moves to
+                     generate, all of them by default
+        """
+
+        moves = []
+        extend = moves.extend
+
+        us = self.side
+        base = us * 6
+        pieces = self.pieces
+        own = self.occupancy[us]
+        enemy = self.occupancy[us ^ 1]
+        empty = ~(own | enemy) & FULL
+        occupied = own | enemy
+
+        # Pawns, pushes are done for all pawns at once by shifting the
+        # bitboard a row forward
+        pawns = pieces[base + PAWN]
+
+        if us == WHITE:
+            single = (pawns >> 8) & empty
+            last_row = ROWS[0]
+            pawn_targets = [single, ((single & ROWS[5]) >> 8) & empty,
+                            (pawns >> 9) & ~FILE_H & enemy,
+                            (pawns >> 7) & ~FILE_A & enemy]
+        else:
+            single = (pawns << 8) & empty
+            last_row = ROWS[7]
+            pawn_targets = [single, ((single & ROWS[2]) << 8) & empty,
+                            (pawns << 7) & ~FILE_H & enemy & FULL,
+                            (pawns << 9) & ~FILE_A & enemy & FULL]
+
+        if kinds != ALL_MOVES:
+            push_mask = ((last_row if kinds & PROMOTION_MOVES else 0)
+                         | (~last_row if kinds & QUIET_MOVES else 0))
+            capture_mask = FULL if kinds & CAPTURE_MOVES else 0
+
+            pawn_targets = [pawn_targets[0] & push_mask,
+                            pawn_targets[1] & push_mask,
+                            pawn_targets[2] & capture_mask,
+                            pawn_targets[3] & capture_mask]
+
+        for targets, move_rows in zip(pawn_targets, PAWN_MOVE_ROWS[us]):
+            while targets:
+                row = ((targets & -targets).bit_length() - 1) >> 3
+                extend(move_rows[row][(targets >> (row << 3)) & 0xFF])
+                targets &= ~ROWS[row]
+
+        if self.ep_square != -1 and kinds & CAPTURE_MOVES:
+            attackers = PAWN_ATTACKS[us ^ 1][self.ep_square] & pawns
+
+            while attackers:
+                low_bit = attackers & -attackers
+                moves.append(encode_move(low_bit.bit_length() - 1,
+                                         self.ep_square))
+                attackers ^= low_bit
+
+        # Only pawns promote
+        if kinds == PROMOTION_MOVES:
+            return moves
+
+        # Every other piece looks up its targets and turns them into moves
+        # through MOVE_LISTS
+        not_own = ((enemy if kinds & CAPTURE_MOVES else 0)
+                   | (empty if kinds & QUIET_MOVES else 0))
+        move_lists = MOVE_LISTS
+
+        for bitboard, table in [(pieces[base + KNIGHT], KNIGHT_ATTACKS),
+                                (pieces[base + KING], KING_ATTACKS)]:
+            while bitboard:
+                low_bit = bitboard & -bitboard
+                initial_pos = low_bit.bit_length() - 1
+                bitboard ^= low_bit
+
+                targets = table[initial_pos] & not_own
+                move_list = move_lists[initial_pos].get(targets)
+                if move_list is None:
+                    move_list = _cache_move_list(initial_pos, targets)
+                extend(move_list)
+
+        # Queens are both diagonal and straight sliders
+        queens = pieces[base + QUEEN]
+
+        for bitboard, tables, masks in [
+                (pieces[base + BISHOP] | queens, BISHOP_TABLES, BISHOP_MASKS),
+                (pieces[base + ROOK] | queens, ROOK_TABLES, ROOK_MASKS)]:
+            while bitboard:
+                low_bit = bitboard & -bitboard
+                initial_pos = low_bit.bit_length() - 1
+                bitboard ^= low_bit
+
+                targets = (tables[initial_pos][occupied & masks[initial_pos]]
+                           & not_own)
+                move_list = move_lists[initial_pos].get(targets)
+                if move_list is None:
+                    move_list = _cache_move_list(initial_pos, targets)
+                extend(move_list)
+
+        # Castling, the king and rook must not have moved and the squares
+        # between them must be empty
+        rights = self.castling & ((CASTLE_WK | CASTLE_WQ) if us == WHITE
+                                  else (CASTLE_BK | CASTLE_BQ))
+
+        if rights and kinds & QUIET_MOVES:
+            for castle in (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ):
+                if rights & castle and not occupied & CASTLE_EMPTY[castle]:
+                    moves.append(CASTLE_MOVES[castle])
+
+        return moves
+
+    def make_move(self, move: int) -> None:
+        """
+        Plays an encoded move on the position and passes the turn, pushing an
+        undo record for unmake_move
+        """
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+        promotion = move >> 12
+
+        mailbox = self.mailbox
+        piece = mailbox[initial_pos]
+        piece_type = piece % 6
+
+        captured_pos = final_pos
+
+        # The pawn taken en passant is behind the square moved to
+        if piece_type == PAWN and final_pos == self.ep_square:
+            captured_pos = final_pos + (8 if self.side == WHITE else -8)
+
+        captured = mailbox[captured_pos]
+
+        self.history.append((move, captured, self.castling, self.ep_square))
+
+        if captured != -1:
+            self.remove_piece(captured_pos)
+
+        self.remove_piece(initial_pos)
+        self.put_piece(final_pos, piece - piece_type + promotion
+                       if promotion else piece)
+
+        # Moving the rook when castling
+        if piece_type == KING and abs(final_pos - initial_pos) == 2:
+            rook_initial, rook_final = CASTLE_ROOKS[final_pos]
+            rook = mailbox[rook_initial]
+            self.remove_piece(rook_initial)
+            self.put_piece(rook_final, rook)
+
+        # Square a pawn skipped over with its double move
+        if piece_type == PAWN and abs(final_pos - initial_pos) == 16:
+            self.ep_square = (initial_pos + final_pos) // 2
+        else:
+            self.ep_square = -1
+
+        self.castling &= CASTLE_KEEP[initial_pos] & CASTLE_KEEP[final_pos]
+        self.side ^= 1
+
+    def unmake_move(self) -> None:
+        """
+        Takes back the last move played with make_move
+        """
+
+        move, captured, castling, ep_square = self.history.pop()
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+        promotion = move >> 12
+
+        self.side ^= 1
+        self.castling = castling
+        self.ep_square = ep_square
+
+        piece = self.mailbox[final_pos]
+        self.remove_piece(final_pos)
+        self.put_piece(initial_pos, piece - promotion + PAWN
+                       if promotion else piece)
+
+        if captured != -1:
+            captured_pos = final_pos
+
+            if piece % 6 == PAWN and final_pos == ep_square:
+                captured_pos = final_pos + (8 if self.side == WHITE else -8)
+
+            self.put_piece(captured_pos, captured)
+
+        # Putting the castled rook back
+        if piece % 6 == KING and abs(final_pos - initial_pos) == 2:
+            rook_initial, rook_final = CASTLE_ROOKS[final_pos]
+            rook = self.mailbox[rook_final]
+            self.remove_piece(rook_final)
+            self.put_piece(rook_initial, rook)
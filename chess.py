@@ -1,9 +1,19 @@
-import pygame
-
 import math
-from typing import List, Tuple
-
-from pieces import Piece, BlankPiece, Pawn, Knight, Bishop, Rook, Queen, King
+from typing import TYPE_CHECKING, Callable, Iterator, List
+
+from pieces import (Piece, BlankPiece, Pawn, Knight, Bishop, Rook, Queen, King,
+                    check_in_bounds)
+from bitboard import (BitboardPosition, KNIGHT, BISHOP, ROOK, QUEEN, KING,
+                      PROMOTIONS, CAPTURE_MOVES, PROMOTION_MOVES, QUIET_MOVES,
+                      ALL_MOVES, CASTLE_ROOKS, BIT, KNIGHT_ATTACKS,
+                      KING_ATTACKS, bishop_attacks, castling_rights,
+                      color_index, encode_move, iter_bits, rook_attacks)
+from compact import CompactPosition
+import evaluation
+import zobrist
+
+if TYPE_CHECKING:
+    import numpy  # Only needed for observations, imported when they are attached
 
 starting_fenstring = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR'  # Standard starting position of a chess board
 
@@ -20,14 +30,46 @@ def get_file(pos: int) -> float:
     """
     return pos % 8
 
+def square_name(pos: int) -> str:
+    """
+    Returns the algebraic name of a position, 0 -> 'a8' and 63 -> 'h1'
+    """
+
+    return 'abcdefgh'[pos % 8] + str(8 - pos // 8)
+
+def parse_square(name: str) -> int:
+    """
+    Returns the position of an algebraic square name, 'a8' -> 0 and 'h1' -> 63
+    """
+
+    if (len(name) != 2 or name[0] not in 'abcdefgh'
+            or name[1] not in '12345678'):
+        raise ValueError(f"Invalid square '{name}'")
+
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+def move_name(move: int) -> str:
+    """
+    Returns an encoded move in coordinate notation, e.g. 'e2e4' or 'a7a8q'
+    """
+
+    promotion = move >> 12
+
+    return (square_name(move & 63) + square_name((move >> 6) & 63)
+            + ('', 'n', 'b', 'r', 'q')[promotion])
+
+# (row, file) steps used to look for attackers of a square
+knight_steps = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1),
+                (2, 1)]
+diagonal_steps = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+straight_steps = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
 
 class ChessGame:
     """
     Class representing a single instance of a game of chess
     """
 
-    square_size: float  # The size of each square of the chess board
-
     board: List[Piece]  # Array that holds each Piece class representing positions on the board
 
     selected_piece: int  # Holds the position of the selected piece
@@ -36,136 +78,843 @@ class ChessGame:
 
     current_color: Piece  # Makes a copy of the selected piece
 
+    history: List[tuple]  # Undo records of every move made, newest last
+    en_passant: int  # Square a pawn can capture en passant onto, -1 if none
+    halfmove_clock: int  # Plies since the last capture or pawn move
+    fullmove_number: int  # Starts at 1 and goes up after each move of black
+
+    _zobrist_key: int  # Zobrist key of the position, see zobrist_key
+    _pawn_key: int  # Zobrist key of the pawns alone, see pawn_key
+    _psq_score: int  # Material and piece-square score for white, see psq_score
+
+    backend: str  # Either 'pieces' or 'bitboard', what generates the moves
+    position: BitboardPosition  # Bitboards mirroring board, None unless the bitboard backend is used
+    _legality: BitboardPosition  # Bitboards mirroring board on the pieces backend, used to filter moves, None otherwise
+
+    incremental: bool  # Only regenerate the moves of pieces a move can change, see update_changed_moves
+    verify_moves: bool  # Cross-check every incremental update against a full regeneration
+    _synced_board: List[Piece]  # Copy of board when moves were last generated, None to regenerate them all
+    _en_passant_pawns: List[int]  # Squares of pawns last given an en passant capture
+    _pseudo_moves: dict  # Square -> (piece, moves, castle_moves) of pieces whose moves were cut down to legal ones
+
+    # NumPy observations, None unless attach_observations was called
+    planes: 'numpy.ndarray'  # (12, 8, 8) uint8, planes[piece.index, row, file] is 1 where a piece stands
+    move_mask: 'numpy.ndarray'  # (64, 64) bool, move_mask[initial_pos, final_pos] is True for legal moves
+
     color_map = {'Colorless': 0, 'Black': -1, 'White': 1}  # Simple dict to make certain pieces of code more readable
 
-    def __init__(self) -> None:
+    backends = ['pieces', 'bitboard']
+
+    promotion_types = {KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook,
+                       QUEEN: Queen}
+
+    fen_piece_types = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook,
+                       'q': Queen, 'k': King, 'P': Pawn, 'N': Knight,
+                       'B': Bishop, 'R': Rook, 'Q': Queen, 'K': King}
+
+    # King and rook squares of each fenstring castling right
+    fen_castling_squares = {'K': (60, 63), 'Q': (60, 56), 'k': (4, 7),
+                            'q': (4, 0)}
+
+    # Piece class of each CompactPosition piece code
+    code_piece_types = [None, Pawn, Knight, Bishop, Rook, Queen, King,
+                        Pawn, Knight, Bishop, Rook, Queen, King]
+
+    def __init__(self, backend: str='pieces', observations: bool=False,
+                 incremental: bool=False, verify_moves: bool=False) -> None:
         """
         Constructor for the ChessGame class
+
+        backend:str -> 'pieces' generates moves with each Piece class,
+                       'bitboard' uses a BitboardPosition kept in sync with
+                       the board
+        observations:bool -> keep NumPy planes and move_mask up to date, see
+                             attach_observations
+        incremental:bool -> with the pieces backend, only regenerate the
+                            moves of pieces the last moves could change
+        verify_moves:bool -> check each incremental update against a full
+                             regeneration, raising an AssertionError when
+                             they differ
         """
 
-        self.square_size = 25
+        if backend not in self.backends:
+            raise ValueError(f"Unknown backend '{backend}', expected one of "
+                             f"{self.backends}")
 
         self.board = []
-        self.highlight_rects = []  # Contains rects to highlight certain squares on the board
         self.history = []
 
+        # One shared BlankPiece per square, placed on the board whenever a
+        # square is emptied instead of creating a new one
+        self.blanks = [BlankPiece(pos) for pos in range(64)]
+
+        self.en_passant = -1
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        self._zobrist_key = 0
+        self._pawn_key = 0
+        self._psq_score = 0
+
         self.selected_piece = BlankPiece(-1)
 
         self.running = True
 
-        self.current_color = self.color_map['Black'] 
+        self.current_color = self.color_map['White']
 
-        
+        self.backend = backend
+        self.position = None
+        self._legality = None
 
-    def load_fenstring(self, fenstring:str=starting_fenstring) -> None:
+        self.incremental = incremental
+        self.verify_moves = verify_moves
+        self._synced_board = None
+        self._en_passant_pawns = []
+        self._pseudo_moves = {}
+
+        self.planes = None
+        self.move_mask = None
+        self._plane_cells = None
+        self._mask_cells = None
+
+        if observations:
+            self.attach_observations()
+
+    def attach_observations(self, planes: 'numpy.ndarray'=None,
+                            move_mask: 'numpy.ndarray'=None) -> None:
+        """
+        Starts keeping planes and move_mask up to date, both can be read at
+        any time without copying
+
+        Arrays to write into can be passed in, e.g. rows of a batch, they
+        are created otherwise. planes are updated in place by every
+        make_move and unmake_move, move_mask by update_move_mask which runs
+        after each move through update_new_position
+        """
+
+        # Only needed for observations, the rest of the game runs without it
+        import numpy
+
+        if planes is None:
+            planes = numpy.zeros((12, 8, 8), dtype=numpy.uint8)
+        if move_mask is None:
+            move_mask = numpy.zeros((64, 64), dtype=bool)
+
+        self.planes = planes
+        self.move_mask = move_mask
+
+        # Flat views of the same memory, indexed by piece.index * 64 + pos
+        # and initial_pos * 64 + final_pos
+        self._plane_cells = planes.reshape(-1)
+        self._mask_cells = move_mask.reshape(-1)
+
+        if self.board:
+            self.reset_planes()
+            self.update_move_mask()
+
+    def reset_planes(self) -> None:
+        """
+        Rewrites planes from the board
+        """
+
+        self._plane_cells[:] = 0
+
+        for piece in self.board:
+            if piece.index != -1:
+                self._plane_cells[piece.index * 64 + piece.pos] = 1
+
+    def update_move_mask(self, moves: List[int]=None) -> None:
+        """
+        Rewrites move_mask from a list of encoded moves, the legal moves of
+        the side to move by default
+        """
+
+        if moves is None:
+            moves = self.legal_moves()
+
+        self._mask_cells[:] = False
+        self._mask_cells[[(move & 63) * 64 + ((move >> 6) & 63)
+                          for move in moves]] = True
+
+    def load_fenstring(self, fenstring:str=starting_fenstring,
+                       gen_moves: bool=True) -> None:
         """
         Positions pieces on the board based off of a fenstring
+
+        Every field after the piece placement is optional. A bare placement
+        gives white the move, with castling rights only if it is the starting
+        position. Castling rights whose king and rook are not on their
+        starting squares are ignored
+
+        gen_moves:bool -> fill in the moves of each piece for the window,
+                          get_moves and legal_moves do not need them
         """
 
-        self.board.clear()
+        fields = fenstring.split()
+
+        if not fields or len(fields) > 6:
+            raise ValueError(f"Invalid fenstring '{fenstring}'")
+
+        placement = fields[0]
 
-        piece_types = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 
-                       'q': Queen, 'k': King}
+        board = self.board
+        board.clear()
+        self.history.clear()
 
-        row, file = 0, 0
+        blanks = self.blanks
+        piece_types = self.fen_piece_types
+        pos = 0
 
-        for char in fenstring:
+        for char in placement:
             if char == '/':
-                row += 1
-                file = 0
-            elif char.isdigit():
-                for i in range(int(char)):
-                    self.board.append(BlankPiece(row * 8 + file))
-                    file += 1 
+                continue
+
+            if char in '12345678':
+                board.extend(blanks[pos:pos + int(char)])
+                pos += int(char)
+            elif char in piece_types:
+                board.append(piece_types[char](pos, 1 if char < 'a' else -1))
+                pos += 1
             else:
-                color = (self.color_map['White'] if char.isupper()
-                         else self.color_map['Black'])
-                
-                piece = piece_types[char.lower()](row * 8 + file, color)
-                piece.scale_sprite(int(self.square_size), int(self.square_size))
-                
-                if fenstring == starting_fenstring and (type(piece) == King 
-                        or type(piece) == Rook):
-                    piece.can_castle = True
+                raise ValueError(f"Invalid piece '{char}' in fenstring "
+                                 f"'{fenstring}'")
+
+        if pos != 64 or len(board) != 64:
+            raise ValueError(f"Fenstring '{fenstring}' does not describe 64 "
+                             "squares")
+
+        side = fields[1] if len(fields) > 1 else 'w'
+        if side not in ('w', 'b'):
+            raise ValueError(f"Invalid side to move '{side}' in fenstring "
+                             f"'{fenstring}'")
+
+        if len(fields) > 2:
+            castling = fields[2]
+        else:
+            castling = 'KQkq' if placement == starting_fenstring else '-'
 
-                self.board.append(piece)
-                file += 1
+        for char in castling.replace('-', ''):
+            if char not in self.fen_castling_squares:
+                raise ValueError(f"Invalid castling rights '{castling}' in "
+                                 f"fenstring '{fenstring}'")
 
-        self.update_new_position()
+            king_pos, rook_pos = self.fen_castling_squares[char]
+            king, rook = board[king_pos], board[rook_pos]
+            color = 1 if char < 'a' else -1
+
+            if (type(king) == King and type(rook) == Rook
+                    and king.color_val == color and rook.color_val == color):
+                king.can_castle = True
+                rook.can_castle = True
+
+        self.current_color = 1 if side == 'w' else -1
+        self.en_passant = -1
+
+        # The square a pawn skipped, on the sixth rank when white is to move
+        # and the third when black is
+        if len(fields) > 3 and fields[3] != '-':
+            en_passant = fields[3]
+
+            if (len(en_passant) != 2 or en_passant[0] not in 'abcdefgh'
+                    or en_passant[1] != ('6' if side == 'w' else '3')):
+                raise ValueError(f"Invalid en passant square '{en_passant}' "
+                                 f"in fenstring '{fenstring}'")
+
+            self.en_passant = parse_square(en_passant)
+
+        for index, name in [(4, 'halfmove clock'), (5, 'fullmove number')]:
+            if len(fields) > index and not fields[index].isdecimal():
+                raise ValueError(f"Invalid {name} '{fields[index]}' in "
+                                 f"fenstring '{fenstring}'")
+
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+        self._setup_position(gen_moves)
+
+    def compact(self) -> CompactPosition:
+        """
+        Returns a CompactPosition snapshot of the current position
+        """
+
+        return CompactPosition(bytes(piece.index + 1 for piece in self.board),
+                               self.current_color, castling_rights(self.board),
+                               self.en_passant, self.halfmove_clock,
+                               self.fullmove_number)
+
+    def load_compact(self, position: CompactPosition,
+                     gen_moves: bool=True) -> None:
+        """
+        Sets up the board from a CompactPosition, like load_fenstring without
+        parsing text
+        """
+
+        board = self.board
+        board.clear()
+        self.history.clear()
+
+        piece_types = self.code_piece_types
+
+        for pos, code in enumerate(position.squares):
+            if code:
+                board.append(piece_types[code](pos, 1 if code < 7 else -1))
+            else:
+                board.append(self.blanks[pos])
+
+        for right, (king_pos, rook_pos) in zip(
+                (1, 2, 4, 8), self.fen_castling_squares.values()):
+            if (position.castling & right and type(board[king_pos]) == King
+                    and type(board[rook_pos]) == Rook):
+                board[king_pos].can_castle = True
+                board[rook_pos].can_castle = True
+
+        self.current_color = position.side
+        self.en_passant = position.ep_square
+        self.halfmove_clock = position.halfmove_clock
+        self.fullmove_number = position.fullmove_number
+
+        self._setup_position(gen_moves)
+
+    def _setup_position(self, gen_moves: bool) -> None:
+        """
+        Brings everything kept alongside the board up to date once a
+        position has been loaded
+        """
+
+        self._zobrist_key = self.compute_zobrist_key()
+        self._pawn_key = self.compute_pawn_key()
+        self._psq_score = self.compute_psq_score()
+        self._synced_board = None
+
+        position = BitboardPosition.from_pieces(self.board,
+                                                self.current_color,
+                                                self.en_passant)
+
+        if self.backend == 'bitboard':
+            self.position = position
+        else:
+            self._legality = position
+            self._pseudo_moves = {}
+
+        if gen_moves:
+            self.gen_legal_moves()
+
+        if self.planes is not None:
+            self.reset_planes()
+            self.update_move_mask()
+
+    def get_fenstring(self) -> str:
+        """
+        Returns the full fenstring of the current position, the inverse of
+        load_fenstring
+        """
+
+        return self.compact().fenstring()
 
     def move(self, initial_pos:int, final_pos:int) -> None:
         """
-        Moves a chess piece
+        Moves a chess piece, pawns reaching the last row become queens
         """
         
-        selected_piece:Piece = self.board[initial_pos]
-        piece_type = type(selected_piece)
+        promotion = 0
 
-        if (piece_type == Pawn and (get_row(final_pos) == 0 
+        if (type(self.board[initial_pos]) == Pawn and (get_row(final_pos) == 0 
                 or get_row(final_pos) == 7)):
-            piece_type = Queen
-        
-        self.board[final_pos] = piece_type(final_pos, 
-                                    selected_piece.color_val)
-        self.board[final_pos].scale_sprite(int(self.square_size), 
-                                           int(self.square_size))
+            promotion = QUEEN
 
-        self.board[initial_pos] = BlankPiece(initial_pos)
+        self.make_move(encode_move(initial_pos, final_pos, promotion))
 
         self.selected_piece = BlankPiece(-1)
 
+    def make_move(self, move:int) -> None:
+        """
+        Plays a move encoded with bitboard.encode_move and passes the turn
+
+        Pieces are moved in place and only a small undo record is pushed onto
+        history, so unmake_move can take back any number of moves
+        """
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+        promotion = move >> 12
+
+        board = self.board
+        piece = board[initial_pos]
+        piece_type = type(piece)
+
+        captured_pos = final_pos
+
+        # The pawn taken en passant is behind the square moved to
+        if piece_type == Pawn and final_pos == self.en_passant:
+            captured_pos = final_pos + 8 * piece.color_val
+
+        captured = board[captured_pos]
+
+        key = self._zobrist_key
+
+        self.history.append((move, piece, captured, captured_pos,
+                             getattr(piece, 'can_castle', False),
+                             self.en_passant, key, self.halfmove_clock,
+                             self._pawn_key, self._psq_score))
+
+        if piece_type == Pawn or captured.index != -1:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        if piece.color_val == -1:
+            self.fullmove_number += 1
+
+        # Castling rights only change when a king or rook moves or a rook is
+        # captured
+        rights_change = (piece_type == King or piece_type == Rook 
+                         or type(captured) == Rook)
+        if rights_change:
+            key ^= zobrist.castling_keys[castling_rights(board)]
+
+        key ^= self.en_passant_key()
+
+        piece_keys = zobrist.piece_keys
+        key ^= piece_keys[piece.index][initial_pos]
+
+        scores = evaluation.square_scores
+        score = self._psq_score - scores[piece.index][initial_pos]
+
+        if captured.index != -1:
+            key ^= piece_keys[captured.index][captured_pos]
+            score -= scores[captured.index][captured_pos]
+
+            if type(captured) == Pawn:
+                self._pawn_key ^= piece_keys[captured.index][captured_pos]
+
+        if piece_type == Pawn:
+            self._pawn_key ^= piece_keys[piece.index][initial_pos]
+
+            if not promotion:
+                self._pawn_key ^= piece_keys[piece.index][final_pos]
+
+        board[captured_pos] = self.blanks[captured_pos]
+        board[initial_pos] = self.blanks[initial_pos]
+
+        if promotion:
+            board[final_pos] = self.promotion_types[promotion](
+                final_pos, piece.color_val)
+            key ^= piece_keys[board[final_pos].index][final_pos]
+        else:
+            key ^= piece_keys[piece.index][final_pos]
+            piece.set_pos(final_pos)
+            board[final_pos] = piece
+
+        score += scores[board[final_pos].index][final_pos]
+
+        if piece_type == King or piece_type == Rook:
+            piece.can_castle = False
+
         # Moving Rook when castling
-        if type(selected_piece) == King and final_pos in selected_piece.castle_moves:
-            if final_pos > selected_piece.pos:
-                self.move(selected_piece.pos + 3, final_pos - 1)
-            else:
-                self.move(selected_piece.pos - 4, final_pos + 1)
+        if piece_type == King and abs(final_pos - initial_pos) == 2:
+            rook_initial, rook_final = CASTLE_ROOKS[final_pos]
+            rook = board[rook_initial]
 
-    def undo_move(self) -> None:
+            board[rook_initial] = self.blanks[rook_initial]
+            rook.set_pos(rook_final)
+            rook.can_castle = False
+            board[rook_final] = rook
+
+            key ^= (piece_keys[rook.index][rook_initial] 
+                    ^ piece_keys[rook.index][rook_final])
+            score += (scores[rook.index][rook_final]
+                      - scores[rook.index][rook_initial])
+
+        self._psq_score = score
+
+        # Square a pawn skipped over with its double move
+        if piece_type == Pawn and abs(final_pos - initial_pos) == 16:
+            self.en_passant = (initial_pos + final_pos) // 2
+        else:
+            self.en_passant = -1
+
+        self.current_color *= -1  # Switching current color
+
+        if rights_change:
+            key ^= zobrist.castling_keys[castling_rights(board)]
+
+        self._zobrist_key = key ^ zobrist.side_key ^ self.en_passant_key()
+
+        cells = self._plane_cells
+        if cells is not None:
+            cells[piece.index * 64 + initial_pos] = 0
+            if captured.index != -1:
+                cells[captured.index * 64 + captured_pos] = 0
+            cells[board[final_pos].index * 64 + final_pos] = 1
+
+            if piece_type == King and abs(final_pos - initial_pos) == 2:
+                cells[rook.index * 64 + rook_initial] = 0
+                cells[rook.index * 64 + rook_final] = 1
+
+        if self.position is not None:
+            self.position.make_move(move)
+        elif self._legality is not None:
+            self._legality.make_move(move)
+
+    def unmake_move(self) -> None:
         """
-        Undoes a move just made
-        
-        Has a limit of 10 moves of history
+        Takes back the last move played with make_move
         """
-        
-        if self.history:
 
-            self.board = self.history[-1]
-            del self.history[-1]
+        (move, piece, captured, captured_pos, can_castle, en_passant,
+         self._zobrist_key, self.halfmove_clock, self._pawn_key,
+         self._psq_score) = self.history.pop()
 
-            self.update_new_position()
-        else:
-            print("You can not undo anymore")
+        if piece.color_val == -1:
+            self.fullmove_number -= 1
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+
+        board = self.board
+        moved_index = board[final_pos].index
+
+        board[final_pos] = self.blanks[final_pos]
+        board[captured_pos] = captured
+
+        piece.set_pos(initial_pos)
+        board[initial_pos] = piece
+
+        if type(piece) == King:
+            piece.can_castle = can_castle
+
+            # Putting the castled rook back
+            if abs(final_pos - initial_pos) == 2:
+                rook_initial, rook_final = CASTLE_ROOKS[final_pos]
+                rook = board[rook_final]
+
+                board[rook_final] = self.blanks[rook_final]
+                rook.set_pos(rook_initial)
+                rook.can_castle = True
+                board[rook_initial] = rook
+        elif type(piece) == Rook:
+            piece.can_castle = can_castle
 
-    def update_history(self):
+        self.en_passant = en_passant
+        self.current_color *= -1
+
+        if self.position is not None:
+            self.position.unmake_move()
+        elif self._legality is not None:
+            self._legality.unmake_move()
+
+        cells = self._plane_cells
+        if cells is not None:
+            # The piece taken off final_pos may have been a promotion
+            cells[moved_index * 64 + final_pos] = 0
+            cells[piece.index * 64 + initial_pos] = 1
+            if captured.index != -1:
+                cells[captured.index * 64 + captured_pos] = 1
+
+            if type(piece) == King and abs(final_pos - initial_pos) == 2:
+                cells[rook.index * 64 + rook_final] = 0
+                cells[rook.index * 64 + rook_initial] = 1
+
+    @property
+    def zobrist_key(self) -> int:
         """
-        Adds the current state to the history array and removes the first
-        state if the limit is exceeded (limit:int = 10)
+        64-bit Zobrist key of the current position, kept up to date by
+        make_move and unmake_move
         """
 
-        self.history.append(self.board.copy())
+        return self._zobrist_key
 
-        if len(self.history) > 10:
-            del self.history[0]
+    @property
+    def pawn_key(self) -> int:
+        """
+        Zobrist key of the pawns alone, indexes evaluation.PawnTable
+        """
+
+        return self._pawn_key
+
+    @property
+    def psq_score(self) -> int:
+        """
+        Material and piece-square score in centipawns from the point of view
+        of white, kept up to date by make_move and unmake_move
+        """
+
+        return self._psq_score
+
+    def compute_pawn_key(self) -> int:
+        """
+        Computes the Zobrist key of the pawns from scratch
+        """
+
+        key = 0
+
+        for piece in self.board:
+            if type(piece) == Pawn:
+                key ^= zobrist.piece_keys[piece.index][piece.pos]
+
+        return key
+
+    def compute_psq_score(self) -> int:
+        """
+        Computes the material and piece-square score from scratch
+        """
+
+        return sum(evaluation.square_scores[piece.index][piece.pos]
+                   for piece in self.board if piece.index != -1)
+
+    def compute_zobrist_key(self) -> int:
+        """
+        Computes the Zobrist key of the current position from scratch
+        """
+
+        key = 0
+
+        for piece in self.board:
+            if piece.index != -1:
+                key ^= zobrist.piece_keys[piece.index][piece.pos]
+
+        if self.current_color == self.color_map['Black']:
+            key ^= zobrist.side_key
+
+        return (key ^ zobrist.castling_keys[castling_rights(self.board)]
+                ^ self.en_passant_key())
+
+    def is_repetition(self, count: int=1) -> bool:
+        """
+        Returns a bool if the current position already occurred in the game,
+        found by comparing Zobrist keys kept in the undo records
+
+        count:int -> earlier occurrences needed, 2 for threefold repetition
+        """
+
+        # Positions with the same side to move are two plies apart, and none
+        # from before the last capture or pawn move can come back
+        first = max(len(self.history) - self.halfmove_clock, 0)
+
+        for i in range(len(self.history) - 2, first - 1, -2):
+            if self.history[i][6] == self._zobrist_key:
+                count -= 1
+
+                if not count:
+                    return True
+
+        return False
+
+    def is_insufficient_material(self) -> bool:
+        """
+        Returns a bool if neither side can possibly mate, bare kings or a
+        king and one minor piece against a king
+        """
+
+        others = [piece for piece in self.board
+                  if piece.color_val != 0 and type(piece) != King]
+
+        return not others or (len(others) == 1
+                              and type(others[0]) in (Knight, Bishop))
+
+    def en_passant_key(self) -> int:
+        """
+        Returns the Zobrist key of the en passant square, it is only hashed
+        when a pawn of the side to move can actually capture en passant
+        """
+
+        if self.en_passant == -1:
+            return 0
+
+        for i in [-1, 1]:
+            pawn = self.board[self.en_passant + 8 * self.current_color + i]
+
+            if (type(pawn) == Pawn and pawn.color_val == self.current_color
+                    and abs(pawn.file - get_file(self.en_passant)) == 1):
+                return zobrist.en_passant_keys[get_file(self.en_passant)]
+
+        return 0
+
+    def undo_move(self) -> None:
+        """
+        Undoes a move just made
+        """
+        
+        if self.history:
+            self.unmake_move()
+            self.update_new_position()
+        else:
+            print("You can not undo anymore")
 
     def update_new_position(self) -> None:
         """
-        Function that runs directly after a move is made
+        Function that runs directly after a move is made or undone
         """
 
         self.gen_legal_moves()
-        self.current_color *= -1  # Switching current color
 
-    
+        if self.move_mask is not None:
+            self.update_move_mask()
 
     def gen_legal_moves(self) -> None:
         """
         Loops over each piece in chess.board and updates what legal moves they 
         can make
+
+        In incremental mode only the pieces that can see a square changed
+        since the last call are regenerated, see update_changed_moves. The
+        pieces generate pseudo-legal moves, those of the side to move are
+        then cut down to legal ones by filter_legal_moves
         """
 
-        for piece in self.board:
-            piece.gen_legal_moves(self.board)
+        if self.position is not None:
+            self.gen_bitboard_moves()
+            return
+
+        if self.incremental and self._synced_board is not None:
+            self.update_changed_moves()
+        else:
+            for piece in self.board:
+                piece.gen_legal_moves(self.board)
+
+            self.gen_special_moves()
+
+        if self.incremental:
+            self._synced_board = self.board.copy()
+
+        self.filter_legal_moves()
+
+    def filter_legal_moves(self) -> None:
+        """
+        Drops the moves of the pieces of the side to move that would leave
+        their king in check, with the pins and check mask of
+        BitboardPosition.legal_moves. Pieces of the other side keep their
+        pseudo-legal moves
+
+        Out of check only the king, pinned pieces and pawns capturing en
+        passant can have illegal moves, the others are left alone. Their
+        pseudo-legal moves are kept in _pseudo_moves for the next
+        incremental update
+        """
+
+        position = self._legality
+        state = position.check_state()
+
+        self._pseudo_moves = {}
+
+        if state is None:
+            return
+
+        king_pos, checkers, check_mask, pins = state
+        board = self.board
+        color = self.current_color
+
+        if checkers:
+            squares = [piece.pos for piece in board if piece.color_val == color]
+        else:
+            squares = {king_pos, *pins, *self._en_passant_pawns}
+
+        pieces = [board[pos] for pos in squares
+                  if board[pos].color_val == color]
+
+        # Promotions are legal or not whatever the pawn becomes, one move per
+        # square is enough
+        legal = set(position.legal_moves(
+            [encode_move(piece.pos, final_pos) for piece in pieces
+             for final_pos in piece.moves + getattr(piece, 'castle_moves', [])],
+            state))
+
+        for piece in pieces:
+            pos = piece.pos
+            castle_moves = getattr(piece, 'castle_moves', None)
+            self._pseudo_moves[pos] = (piece, piece.moves, castle_moves)
+
+            piece.moves = [final_pos for final_pos in piece.moves
+                           if encode_move(pos, final_pos) in legal]
+
+            if castle_moves:
+                piece.castle_moves = [final_pos for final_pos in castle_moves
+                                      if encode_move(pos, final_pos) in legal]
+
+    def update_changed_moves(self) -> None:
+        """
+        Regenerates the moves of the pieces standing on or able to see a
+        square whose piece changed since moves were last generated
+
+        Seeing is symmetric, a piece sees a square when the same piece on
+        that square would see it back. Pawns only look one square along a
+        file or diagonal, or two along a file past an empty square, so king
+        steps and rook rays from the square find them. The first changed
+        square along a ray is seen both before and after the move, so looking
+        from the new position is enough
+        """
+
+        board = self.board
+        synced = self._synced_board
+
+        # Moves cut down to legal ones after the last update go back to the
+        # pseudo-legal moves kept before that
+        for pos, (piece, moves, castle_moves) in self._pseudo_moves.items():
+            if board[pos] is piece:
+                piece.moves = moves
+
+                if castle_moves is not None:
+                    piece.castle_moves = castle_moves
+
+        occupancy = self._legality.occupancy
+        occupied = occupancy[0] | occupancy[1]
+
+        changed = [pos for pos, piece, synced_piece in zip(range(64), board,
+                                                           synced)
+                   if piece is not synced_piece]
+
+        # Pawns given an en passant capture last time lose it again
+        changed.extend(self._en_passant_pawns)
+
+        on = 0
+        knights = 0
+        kings = 0
+        straight = 0
+        diagonal = 0
+
+        for pos in changed:
+            on |= BIT[pos]
+            knights |= KNIGHT_ATTACKS[pos]
+            kings |= KING_ATTACKS[pos]
+            straight |= rook_attacks(pos, occupied)
+            diagonal |= bishop_attacks(pos, occupied)
+
+        # Squares from which each piece type would see a changed square,
+        # pawns are covered by king steps and the two squares along a file
+        seen_from = [kings | straight, knights, diagonal, straight,
+                     straight | diagonal, kings]
+
+        for pos in iter_bits((on | kings | straight | diagonal | knights)
+                             & occupied):
+            piece = board[pos]
+
+            if BIT[pos] & (on | seen_from[piece.piece_type]):
+                piece.gen_legal_moves(board)
+
+        self.gen_special_moves()
+
+        if self.verify_moves:
+            updated = [(sorted(piece.moves), getattr(piece, 'castle_moves', []))
+                       for piece in board]
+
+            for piece in board:
+                piece.gen_legal_moves(board)
+
+            self.gen_special_moves()
+
+            for piece, (moves, castle_moves) in zip(board, updated):
+                if (sorted(piece.moves) != moves
+                        or getattr(piece, 'castle_moves', []) != castle_moves):
+                    raise AssertionError(
+                        f'Incremental moves of {type(piece).__name__} on '
+                        f'{square_name(piece.pos)} were {moves}, full '
+                        f'regeneration gives {sorted(piece.moves)}')
+
+    def gen_special_moves(self) -> None:
+        """
+        Adds castling and en passant captures to the moves of the pieces,
+        they depend on more than the squares each piece sees
+        """
 
         king_start_pos = [4, 60]
         for i in king_start_pos:
@@ -173,172 +922,223 @@ class ChessGame:
 
             if type(king) == King:
                 if king.can_castle:
+                    # Castling through check is left to filter_legal_moves
                     king.check_castle(self.board)
+                else:
+                    king.castle_moves = []
 
-    def set_square_size(self, square_size: int) -> None:
-        
-        self.square_size = square_size
+        self._en_passant_pawns = []
+
+        # En passant captures for the side to move
+        if self.en_passant != -1:
+            for i in [-1, 1]:
+                pawn_pos = self.en_passant + 8 * self.current_color + i
+                pawn = self.board[pawn_pos]
+
+                if (type(pawn) == Pawn and pawn.color_val == self.current_color
+                        and abs(pawn.file - get_file(self.en_passant)) == 1):
+                    pawn.moves.append(self.en_passant)
+                    self._en_passant_pawns.append(pawn_pos)
+
+    def gen_bitboard_moves(self) -> None:
+        """
+        Fills in the legal moves of each piece of the side to move from the
+        bitboard backend, pieces of the other side are left without moves
+        """
 
         for piece in self.board:
-            piece.scale_sprite(int(self.square_size), int(self.square_size))
+            piece.moves.clear()
 
+            if type(piece) == King:
+                piece.castle_moves = []
 
-class WindowManager:
-    """
-    Class to manage all the rendering displaying and user input
-    """
+        for move in self.position.legal_moves():
+            initial_pos = move & 63
+            final_pos = (move >> 6) & 63
+            piece = self.board[initial_pos]
+
+            if type(piece) == King and abs(final_pos - initial_pos) == 2:
+                piece.castle_moves.append(final_pos)
+            elif move >> 12 in (0, QUEEN):  # One tile per promotion
+                piece.moves.append(final_pos)
+
+    def get_moves(self) -> List[int]:
+        """
+        Returns the moves of the side to move encoded with
+        bitboard.encode_move, pseudo-legal on the bitboard backend and legal
+        on the pieces backend, which filters them as they are generated
+        """
 
-    win_width: int 
-    win_height: int 
+        if self.position is not None:
+            return self.position.gen_moves()
 
-    window: pygame.Surface
+        self.gen_legal_moves()
 
-    square_size: float  # The width/height of across for each tile of the board
+        moves = []
 
-    board_rects: List[pygame.Rect]  # List holding colored squares representing the chess board
-    
-    # Hold the rectangles that are drawn to make up the chessboard.
-    # Surface used instead of Rect for transparancy
-    highlight_rects: List[Tuple[pygame.Surface, Tuple[int]]]
-    highlight_alpha: int  # defines how transparent highlighted squares are
+        for piece in self.board:
+            if piece.color_val != self.current_color:
+                continue
+
+            for final_pos in piece.moves:
+                if type(piece) == Pawn and (get_row(final_pos) == 0 
+                        or get_row(final_pos) == 7):
+                    for promotion in PROMOTIONS:
+                        moves.append(encode_move(piece.pos, final_pos,
+                                                 promotion))
+                else:
+                    moves.append(encode_move(piece.pos, final_pos))
 
-    _light_color: pygame.Color 
-    _dark_color: pygame.Color
-    _highlight_color: pygame.Color   
+            if type(piece) == King:
+                for final_pos in piece.castle_moves:
+                    moves.append(encode_move(piece.pos, final_pos))
 
-    def __init__(self, window_width: int, window_height: int, name: str="Chess") -> None:
+        return moves
+
+    def legal_moves(self) -> List[int]:
         """
-        Window Manager constructor
+        Returns the moves of get_moves that do not leave the side to move in
+        check, see BitboardPosition.legal_moves
+        """
+
+        if self.position is not None:
+            return self.position.legal_moves()
+
+        # The moves of the pieces are already cut down, see filter_legal_moves
+        return self.get_moves()
+
+    def staged_moves(self, tt_move: int=0,
+                     quiet_key: Callable[[int], int]=None,
+                     kinds: int=ALL_MOVES) -> Iterator[int]:
+        """
+        Yields the legal moves of the side to move a stage at a time: the
+        hash move, captures by MVV-LVA, promotions and then quiet moves
+
+        On the bitboard backend a stage is only generated once every move of
+        the stage before it has been taken, so a search cutting off on the
+        hash move or a capture never generates the quiet moves. The pieces
+        backend already holds all its moves and only splits them into the
+        same stages. Moves may be made and unmade between yields as long as
+        the position is back to where it was
+
+        tt_move:int -> move to try first, skipped unless it is legal here
+        quiet_key:Callable -> sort key of quiet moves, highest first, left in
+                              generation order without one
+        kinds:int -> bitboard CAPTURE_MOVES, PROMOTION_MOVES and QUIET_MOVES
+                     bits of the stages to yield
         """
-        
-        pygame.init()
 
+        position = self.position
+        moves = None
 
-        self.win_width = window_width
-        self.win_height = window_height
+        if position is None:
+            position = self._legality
+            moves = self.get_moves()
 
-        self.window = pygame.display.set_mode((self.win_width, self.win_height))
+        state = position.check_state()
 
-        pygame.display.set_caption(name)
+        if (tt_move and kinds & position.move_kind(tt_move)
+                and position.is_pseudo_legal(tt_move)
+                and position.legal_moves([tt_move], state)):
+            yield tt_move
 
-        self.square_size = self.win_width / 8 
+        mailbox = position.mailbox
+        piece_values = evaluation.piece_values
 
-        self.board_rects = [] 
+        for stage in (CAPTURE_MOVES, PROMOTION_MOVES, QUIET_MOVES):
+            if not kinds & stage:
+                continue
 
-        # Initializing the board_rects array
-        for i in range(64):
-            row = math.floor(i / 8)
-            file = i % 8
+            if moves is None:
+                stage_moves = position.gen_moves(stage)
+            else:
+                stage_moves = [move for move in moves
+                               if position.move_kind(move) == stage]
+
+            stage_moves = position.legal_moves(stage_moves, state)
+
+            if stage == CAPTURE_MOVES:
+                # Most valuable victim first, least valuable attacker second,
+                # en passant captures land on an empty square
+                stage_moves.sort(key=lambda move: (
+                    10 * piece_values[max(mailbox[(move >> 6) & 63], 0) % 6]
+                    - mailbox[move & 63] % 6), reverse=True)
+            elif stage == PROMOTION_MOVES:
+                # Queens first, then the pieces worth the most
+                stage_moves.sort(key=lambda move: move >> 12, reverse=True)
+            elif stage == QUIET_MOVES and quiet_key is not None:
+                stage_moves.sort(key=quiet_key, reverse=True)
+
+            for move in stage_moves:
+                if move != tt_move:
+                    yield move
+
+    def in_check(self, color: int) -> bool:
+        """
+        Returns a bool if the king of a color is attacked
+        """
 
-            self.board_rects.append(pygame.Rect(file * self.square_size, row
-                                                * self.square_size,
-                                                self.square_size,
-                                                self.square_size))
+        if self.position is not None:
+            king = self.position.pieces[color_index(color) * 6 + KING]
 
-        self.highlight_rects = []
-        self.highlight_alpha = 77  # 77 -> 50% transparancy
+            return bool(king) and self.position.is_attacked(
+                king.bit_length() - 1, color_index(-color))
 
-        # Colors
-        self._light_color = pygame.Color(240, 240, 240)
-        self._dark_color = pygame.Color(46, 139, 87)
-        self._highlight_color = pygame.Color(255, 0, 0)
+        for piece in self.board:
+            if type(piece) == King and piece.color_val == color:
+                return self.is_attacked(piece.pos, -color)
 
-        self.chess_game = ChessGame()
+        return False
 
-    def highlight_legal_moves(self, selected_piece: Piece) -> None:
+    def is_attacked(self, pos: int, color: int) -> bool:
         """
-        Highlights all tiles a selected piece can move to
+        Returns a bool if a square is attacked by any piece of a color
         """
 
-        self.highlight_rects.clear()
+        if self.position is not None:
+            return self.position.is_attacked(pos, color_index(color))
 
-        moves:List[int] = selected_piece.moves
+        board = self.board
+        row, file = get_row(pos), get_file(pos)
 
-        if type(selected_piece) == King:
-            moves += selected_piece.castle_moves
+        # Pawns capture towards the other side, so an attacking pawn stands
+        # one row behind the square from its own point of view
+        for file_step in [-1, 1]:
+            next_row, next_file = row + color, file + file_step
 
-        for move in moves:
+            if check_in_bounds(next_row, next_file):
+                piece = board[next_row * 8 + next_file]
 
-            row = get_row(move)
-            file = get_file(move)
+                if type(piece) == Pawn and piece.color_val == color:
+                    return True
 
-            rect = pygame.Surface((self.square_size, self.square_size))
-            rect.set_alpha(self.highlight_alpha)  # Adding transparancy
-            rect.fill(self._highlight_color)
-            pos = (file * self.square_size, row * self.square_size)
+        for steps, piece_type in [(knight_steps, Knight),
+                                  (diagonal_steps + straight_steps, King)]:
+            for row_step, file_step in steps:
+                next_row, next_file = row + row_step, file + file_step
 
-            self.highlight_rects.append((rect, pos))
+                if check_in_bounds(next_row, next_file):
+                    piece = board[next_row * 8 + next_file]
 
-    def poll_events(self, curr_game: ChessGame) -> None:
-        """
-        Takes input from the user
-        """
+                    if type(piece) == piece_type and piece.color_val == color:
+                        return True
 
-        for event in pygame.event.get():
-            
-            # Quitting the window
-            if event.type == pygame.QUIT:
-                curr_game.running = False
+        # Sliding pieces, the first piece along each line is the only one
+        # that can attack
+        for steps, piece_types in [(diagonal_steps, (Bishop, Queen)),
+                                   (straight_steps, (Rook, Queen))]:
+            for row_step, file_step in steps:
+                next_row, next_file = row + row_step, file + file_step
 
-            # Mouse input
-            if event.type == pygame.MOUSEBUTTONUP:
-                
-                # Getting position of the mouse
-                x, y = pygame.mouse.get_pos()
-                row = math.floor(y / self.square_size)
-                file = math.floor(x / self.square_size)
-                pos = row * 8 + file
+                while check_in_bounds(next_row, next_file):
+                    piece = board[next_row * 8 + next_file]
 
-                # Selecting where to move a piece (2nd click)
-                if pos in curr_game.selected_piece.moves:
-                    curr_game.update_history()
-                    curr_game.move(curr_game.selected_piece.pos, pos)
-                    curr_game.update_new_position()
+                    if piece.color_val != 0:
+                        if (type(piece) in piece_types 
+                                and piece.color_val == color):
+                            return True
+                        break
 
-                    self.highlight_rects.clear()
-                # Selecting a piece
-                elif curr_game.board[pos].color_val == curr_game.current_color:
-                    curr_game.selected_piece = curr_game.board[pos]
-                    self.highlight_legal_moves(curr_game.selected_piece)
-                else:
-                    curr_game.selected_piece = BlankPiece(-1)
-                    self.highlight_rects.clear()
-            
-            # Keyboard input
-            if event.type == pygame.KEYUP:
-                if event.key == pygame.K_u:
-                    curr_game.undo_move()
-
-    def render_window(self, chess_board: List[Piece]) -> None:
-        """
-        Function containing code to render to the pygame window
-        """
-
-        # Drawing the chess board
-        for i, rect in enumerate(self.board_rects):
-            color = (self._light_color if (get_file(i) + get_row(i))
-                     % 2 == 0 else self._dark_color)
-            pygame.draw.rect(self.window, color, rect)
-
-        # Highlighting squares
-        for rect, pos in self.highlight_rects:
-            self.window.blit(rect, pos) 
-
-        # Drawing the chess pieces on the board
-        for piece in chess_board:
-            if type(piece) != BlankPiece:
-                self.window.blit(piece.sprite, (piece.file * self.square_size,
-                                piece.row * self.square_size))
-       
-        pygame.display.update()
-
-if __name__ == '__main__':
-    chess = ChessGame()
-
-    chess.load_fenstring("8/8/8/4n3/8/8/8/8")
-
-    while chess.running:
-        chess.poll_events()
-        chess.gen_legal_moves()
-        chess.gen_highlighted()
-        chess.render_window()
+                    next_row, next_file = next_row + row_step, next_file + file_step
+
+        return False
@@ -0,0 +1,203 @@
+import struct
+
+from typing import List
+
+from bitboard import (PAWN, KING, WHITE, BLACK, CASTLE_ROOKS, CASTLE_KEEP,
+                      BitboardPosition)
+
+# Squares, side to move, castling rights, en passant square and both clocks
+_record = struct.Struct('<64sbBbHH')
+record_size = _record.size
+
+piece_chars = ' PNBRQKpnbrqk'  # By piece code, 0 is an empty square
+
+
+class CompactPosition:
+    """
+    Position stored as one byte per square plus a few ints, small enough to
+    keep millions of them around
+
+    Squares hold piece codes, 0 for an empty square and piece index + 1
+    otherwise. Copying, comparing and hashing work on the bytes directly
+    """
+
+    __slots__ = ('squares', 'side', 'castling', 'ep_square', 'halfmove_clock',
+                 'fullmove_number')
+
+    squares: bytearray  # Piece code of each square, numbered like ChessGame.board
+    side: int  # color_val of the side to move, 1 White and -1 Black
+    castling: int  # Castling rights bits
+    ep_square: int  # Square a pawn can capture en passant onto, -1 if none
+    halfmove_clock: int
+    fullmove_number: int
+
+    def __init__(self, squares: bytes=bytes(64), side: int=1,
+                 castling: int=0, ep_square: int=-1, halfmove_clock: int=0,
+                 fullmove_number: int=1) -> None:
+        """
+        Constructor for the CompactPosition class, an empty board by default
+        """
+
+        self.squares = bytearray(squares)
+        self.side = side
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CompactPosition':
+        """
+        Builds a position from a record written by to_bytes
+        """
+
+        return cls(*_record.unpack(data))
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the position as a fixed size record of record_size bytes
+        """
+
+        return _record.pack(bytes(self.squares), self.side, self.castling,
+                            self.ep_square, self.halfmove_clock,
+                            self.fullmove_number)
+
+    def copy(self) -> 'CompactPosition':
+        """
+        Returns an independent copy of the position
+        """
+
+        return CompactPosition(self.squares, self.side, self.castling,
+                               self.ep_square, self.halfmove_clock,
+                               self.fullmove_number)
+
+    def _state(self) -> tuple:
+        # Clocks are left out, they do not change what can happen next
+        return (bytes(self.squares), self.side, self.castling, self.ep_square)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CompactPosition):
+            return NotImplemented
+
+        return self._state() == other._state()
+
+    def __hash__(self) -> int:
+        return hash(self._state())
+
+    def __repr__(self) -> str:
+        return f"CompactPosition('{self.fenstring()}')"
+
+    def to_bitboard(self) -> BitboardPosition:
+        """
+        Returns a BitboardPosition of the same position
+        """
+
+        position = BitboardPosition()
+        position.side = WHITE if self.side == 1 else BLACK
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+
+        for pos, code in enumerate(self.squares):
+            if code:
+                position.put_piece(pos, code - 1)
+
+        return position
+
+    def gen_moves(self) -> List[int]:
+        """
+        Returns every pseudo-legal move of the side to move, encoded with
+        bitboard.encode_move
+        """
+
+        return self.to_bitboard().gen_moves()
+
+    def legal_moves(self) -> List[int]:
+        """
+        Returns the moves of gen_moves that do not leave the side to move in
+        check
+        """
+
+        return self.to_bitboard().legal_moves()
+
+    def make_move(self, move: int) -> None:
+        """
+        Plays an encoded move in place and passes the turn, there is no undo
+        so positions to come back to are copied first
+        """
+
+        initial_pos = move & 63
+        final_pos = (move >> 6) & 63
+        promotion = move >> 12
+
+        squares = self.squares
+        code = squares[initial_pos]
+        piece_type = (code - 1) % 6
+
+        captured_pos = final_pos
+
+        # The pawn taken en passant is behind the square moved to
+        if piece_type == PAWN and final_pos == self.ep_square:
+            captured_pos = final_pos + 8 * self.side
+
+        if piece_type == PAWN or squares[captured_pos]:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        squares[captured_pos] = 0
+        squares[initial_pos] = 0
+        squares[final_pos] = code - piece_type + promotion if promotion else code
+
+        # Moving the rook when castling
+        if piece_type == KING and abs(final_pos - initial_pos) == 2:
+            rook_initial, rook_final = CASTLE_ROOKS[final_pos]
+            squares[rook_final] = squares[rook_initial]
+            squares[rook_initial] = 0
+
+        # Square a pawn skipped over with its double move
+        if piece_type == PAWN and abs(final_pos - initial_pos) == 16:
+            self.ep_square = (initial_pos + final_pos) // 2
+        else:
+            self.ep_square = -1
+
+        self.castling &= CASTLE_KEEP[initial_pos] & CASTLE_KEEP[final_pos]
+
+        if self.side == -1:
+            self.fullmove_number += 1
+
+        self.side = -self.side
+
+    def fenstring(self) -> str:
+        """
+        Returns the full fenstring of the position
+        """
+
+        rows = []
+
+        for row in range(8):
+            text = ''
+            empty = 0
+
+            for code in self.squares[row * 8:row * 8 + 8]:
+                if not code:
+                    empty += 1
+                    continue
+
+                if empty:
+                    text += str(empty)
+                    empty = 0
+
+                text += piece_chars[code]
+
+            rows.append(text + (str(empty) if empty else ''))
+
+        castling = ''.join(char for char, right in zip('KQkq', (1, 2, 4, 8))
+                           if self.castling & right)
+
+        return ' '.join(['/'.join(rows), 'w' if self.side == 1 else 'b',
+                         castling or '-',
+                         ('-' if self.ep_square == -1
+                          else 'abcdefgh'[self.ep_square % 8]
+                          + str(8 - self.ep_square // 8)),
+                         str(self.halfmove_clock),
+                         str(self.fullmove_number)])
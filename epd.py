@@ -0,0 +1,94 @@
+from typing import Dict, Iterator, Tuple
+
+from chess import ChessGame
+
+
+def parse_operations(text: str) -> Dict[str, str]:
+    """
+    Parses the operations of an EPD record, e.g. 'bm Nf3; id "WAC.001";'
+    gives {'bm': 'Nf3', 'id': 'WAC.001'}
+
+    Operands are kept as one string, a single quoted operand loses its quotes
+    """
+
+    operations = {}
+
+    # Quoted operands may hold semicolons, anything else splits on them
+    if '"' in text:
+        parts = []
+        start = 0
+        quoted = False
+
+        for i, char in enumerate(text):
+            if char == '"':
+                quoted = not quoted
+            elif char == ';' and not quoted:
+                parts.append(text[start:i])
+                start = i + 1
+
+        parts.append(text[start:])
+    else:
+        parts = text.split(';')
+
+    for part in parts:
+        opcode, _, operand = part.strip().partition(' ')
+
+        if not opcode:
+            continue
+
+        operand = operand.strip()
+        if (len(operand) > 1 and operand[0] == '"' and operand[-1] == '"'
+                and operand.count('"') == 2):
+            operand = operand[1:-1]
+
+        operations[opcode] = operand
+
+    return operations
+
+def parse_epd(line: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Splits an EPD record into a full fenstring and its operations
+
+    The clocks of the fenstring come from the hmvc and fmvn operations, 0 and
+    1 without them
+    """
+
+    fields = line.split(None, 4)
+
+    if len(fields) < 4:
+        raise ValueError(f"Invalid EPD record '{line}'")
+
+    operations = parse_operations(fields[4]) if len(fields) > 4 else {}
+
+    fenstring = ' '.join(fields[:4] + [operations.get('hmvc', '0'),
+                                       operations.get('fmvn', '1')])
+
+    return fenstring, operations
+
+def read_epd(path: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    Yields the fenstring and operations of each record of an EPD file
+
+    The file is read one line at a time, so files of any size can be streamed
+    through. Blank lines and lines starting with '#' are skipped
+    """
+
+    with open(path, encoding='utf-8', errors='replace',
+              buffering=1 << 20) as file:
+        for line in file:
+            line = line.strip()
+
+            if line and line[0] != '#':
+                yield parse_epd(line)
+
+def load_epd(game: ChessGame, path: str) -> Iterator[Dict[str, str]]:
+    """
+    Loads each record of an EPD file into the same game in turn, yielding its
+    operations once the position is set up
+
+    The moves of each piece are not filled in, see ChessGame.load_fenstring
+    """
+
+    for fenstring, operations in read_epd(path):
+        game.load_fenstring(fenstring, gen_moves=False)
+        yield operations
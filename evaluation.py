@@ -0,0 +1,230 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from bitboard import PAWN, WHITE, BLACK, FILE_A, BIT, iter_bits
+
+if TYPE_CHECKING:
+    from chess import ChessGame  # chess imports this module
+
+piece_values = [100, 320, 330, 500, 900, 0]  # Centipawns by piece type
+
+# Piece-square tables by piece type, bonuses in centipawns for white pieces
+# on squares numbered like ChessGame.board (a8 first). Black pieces use the
+# square mirrored across the middle of the board
+piece_square_tables = [
+    # Pawn
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+      50,  50,  50,  50,  50,  50,  50,  50,
+      10,  10,  20,  30,  30,  20,  10,  10,
+       5,   5,  10,  25,  25,  10,   5,   5,
+       0,   0,   0,  20,  20,   0,   0,   0,
+       5,  -5, -10,   0,   0, -10,  -5,   5,
+       5,  10,  10, -20, -20,  10,  10,   5,
+       0,   0,   0,   0,   0,   0,   0,   0],
+    # Knight
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20,   0,   0,   0,   0, -20, -40,
+     -30,   0,  10,  15,  15,  10,   0, -30,
+     -30,   5,  15,  20,  20,  15,   5, -30,
+     -30,   0,  15,  20,  20,  15,   0, -30,
+     -30,   5,  10,  15,  15,  10,   5, -30,
+     -40, -20,   0,   5,   5,   0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    # Bishop
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,  10,  10,   5,   0, -10,
+     -10,   5,   5,  10,  10,   5,   5, -10,
+     -10,   0,  10,  10,  10,  10,   0, -10,
+     -10,  10,  10,  10,  10,  10,  10, -10,
+     -10,   5,   0,   0,   0,   0,   5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    # Rook
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+       5,  10,  10,  10,  10,  10,  10,   5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+       0,   0,   0,   5,   5,   0,   0,   0],
+    # Queen
+    [-20, -10, -10,  -5,  -5, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,   5,   5,   5,   0, -10,
+      -5,   0,   5,   5,   5,   5,   0,  -5,
+       0,   0,   5,   5,   5,   5,   0,  -5,
+     -10,   5,   5,   5,   5,   5,   0, -10,
+     -10,   0,   5,   0,   0,   0,   0, -10,
+     -20, -10, -10,  -5,  -5, -10, -10, -20],
+    # King, kept behind its pawns
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+      20,  20,   0,   0,   0,   0,  20,  20,
+      20,  30,  10,   0,   0,  10,  30,  20],
+]
+
+# Material plus piece-square score of every piece index on every square, from
+# the point of view of white, so a position scores the sum over its pieces
+square_scores: List[List[int]] = (
+    [[piece_values[piece_type] + table[pos] for pos in range(64)]
+     for piece_type, table in enumerate(piece_square_tables)]
+    + [[-piece_values[piece_type] - table[pos ^ 56] for pos in range(64)]
+       for piece_type, table in enumerate(piece_square_tables)])
+
+# Pawn structure terms in centipawns
+doubled_penalty = 10  # Every pawn on a file after the first
+isolated_penalty = 15  # Pawns without pawns of their color on either side
+passed_bonus = [0, 10, 15, 25, 40, 65, 100, 0]  # By rows advanced
+
+FILES = [FILE_A << file for file in range(8)]
+ADJACENT_FILES = [(FILES[file - 1] if file > 0 else 0)
+                  | (FILES[file + 1] if file < 7 else 0)
+                  for file in range(8)]
+
+
+def _passed_masks(color: int) -> List[int]:
+    """
+    Builds the squares in front of a pawn of a color index, on its own and
+    the neighbouring files, that must hold no enemy pawns for it to be passed
+    """
+
+    masks = []
+
+    for pos in range(64):
+        row, file = pos >> 3, pos & 7
+        rows = range(row) if color == WHITE else range(row + 1, 8)
+
+        mask = 0
+        for next_row in rows:
+            for next_file in range(max(file - 1, 0), min(file + 2, 8)):
+                mask |= BIT[next_row * 8 + next_file]
+
+        masks.append(mask)
+
+    return masks
+
+PASSED_MASKS = [_passed_masks(WHITE), _passed_masks(BLACK)]
+
+
+def pawn_structure(white_pawns: int, black_pawns: int) -> int:
+    """
+    Scores doubled, isolated and passed pawns from the point of view of
+    white, given the pawn bitboard of each color
+    """
+
+    score = 0
+
+    for color, pawns, enemy_pawns, sign in [
+            (WHITE, white_pawns, black_pawns, 1),
+            (BLACK, black_pawns, white_pawns, -1)]:
+        for file in range(8):
+            count = (pawns & FILES[file]).bit_count()
+
+            if count > 1:
+                score -= sign * doubled_penalty * (count - 1)
+            if count and not pawns & ADJACENT_FILES[file]:
+                score -= sign * isolated_penalty * count
+
+        for pos in iter_bits(pawns):
+            if not enemy_pawns & PASSED_MASKS[color][pos]:
+                advanced = 6 - (pos >> 3) if color == WHITE else (pos >> 3) - 1
+                score += sign * passed_bonus[advanced]
+
+    return score
+
+def pawn_bitboards(game: 'ChessGame') -> Tuple[int, int]:
+    """
+    Returns the white and black pawn bitboards of a game on either backend
+    """
+
+    if game.position is not None:
+        pieces = game.position.pieces
+        return pieces[PAWN], pieces[PAWN + 6]
+
+    pawns = [0, 0]
+
+    for piece in game.board:
+        if piece.piece_type == PAWN and piece.color_val != 0:
+            pawns[piece.color_val == -1] |= BIT[piece.pos]
+
+    return pawns[0], pawns[1]
+
+
+class PawnTable:
+    """
+    Fixed size hash table of pawn structure scores indexed by the Zobrist key
+    of the pawns alone, which change far less often than the rest of the
+    position
+    """
+
+    keys: List[int]
+    scores: List[int]
+    mask: int  # Number of entries - 1, used to index the table with a key
+
+    hits: int
+    misses: int
+
+    def __init__(self, size: int=1 << 14) -> None:
+        """
+        Constructor for the PawnTable class
+
+        size:int -> number of entries, rounded down to a power of two
+        """
+
+        size = 1 << (size.bit_length() - 1)
+
+        self.keys = [-1] * size
+        self.scores = [0] * size
+        self.mask = size - 1
+
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key: int) -> Optional[int]:
+        """
+        Returns the score stored for a pawn key, None if there is none
+        """
+
+        index = key & self.mask
+
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+
+        self.misses += 1
+        return None
+
+    def store(self, key: int, score: int) -> None:
+        """
+        Stores the score of a pawn key, replacing whatever shared its slot
+        """
+
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+
+def evaluate(game: 'ChessGame', pawn_table: PawnTable=None) -> int:
+    """
+    Material, piece-square and pawn structure score in centipawns from the
+    point of view of the side to move
+
+    The material and piece-square part is kept up to date by make_move, the
+    pawn structure is worked out only when pawn_table has no score for the
+    pawn key of the game
+    """
+
+    key = game.pawn_key
+    pawns = pawn_table.probe(key) if pawn_table is not None else None
+
+    if pawns is None:
+        pawns = pawn_structure(*pawn_bitboards(game))
+
+        if pawn_table is not None:
+            pawn_table.store(key, pawns)
+
+    return (game.psq_score + pawns) * game.current_color
@@ -1,13 +1,34 @@
-from chess import ChessGame, WindowManager
+import argparse
 
-chess = ChessGame()
-window = WindowManager(800, 800)
+import pygame
+
+from chess import ChessGame
+from window import WindowManager
+
+parser = argparse.ArgumentParser(description='Plays chess in a window')
+parser.add_argument('--engine', choices=['white', 'black'], default=None,
+                    help='color the engine plays, nobody by default')
+parser.add_argument('--time', type=float, default=1.0,
+                    help='seconds the engine thinks for each move')
+parser.add_argument('--fps', type=int, default=60,
+                    help='most frames drawn each second')
+args = parser.parse_args()
+
+engine_color = {None: 0, 'white': 1, 'black': -1}[args.engine]
+
+chess = ChessGame('bitboard')
+window = WindowManager(800, 800, engine_color=engine_color,
+                       engine_time=args.time)
 
-chess.set_square_size(window.square_size)
 # chess.load_fenstring("8/5p2/8/5P2/8/8/3p4/4K3")
 # chess.load_fenstring('8/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR')
 chess.load_fenstring()
 
+clock = pygame.time.Clock()
+
+# poll_events sleeps until there is an event, the clock caps how often the
+# window is drawn when events arrive quickly
 while chess.running:
     window.poll_events(chess)
     window.render_window(chess.board)
+    clock.tick(args.fps)
@@ -0,0 +1,417 @@
+import argparse
+import importlib
+import math
+import multiprocessing
+import time
+
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from chess import ChessGame, starting_fenstring
+from epd import read_epd
+from pgn import game_result, played_moves, format_pgn
+from search import Searcher, TranspositionTable
+
+default_opening = starting_fenstring + ' w KQkq - 0 1'
+
+
+class EngineConfig(NamedTuple):
+    """
+    One side of a match, the search limits of each move or an agent
+
+    agent is a 'module:function' path to a function taking a ChessGame and
+    returning a legal move, used instead of searching when given
+    """
+
+    name: str
+    depth: Optional[int] = None
+    movetime: Optional[float] = None  # Seconds per move
+    nodes: Optional[int] = None
+    agent: Optional[str] = None
+    hash_size: int = 1 << 18  # Transposition table entries
+
+    @classmethod
+    def parse(cls, text: str) -> 'EngineConfig':
+        """
+        Builds a config from 'name=new,depth=4' style text, a search of
+        0.1 seconds per move is used when no limit is given
+        """
+
+        fields = {}
+
+        for part in text.split(','):
+            key, _, value = part.partition('=')
+
+            if key not in cls._fields or not value:
+                raise ValueError(f"Invalid engine option '{part}', expected "
+                                 f"one of {list(cls._fields)}")
+
+            if key in ('depth', 'nodes', 'hash_size'):
+                fields[key] = int(value)
+            elif key == 'movetime':
+                fields[key] = float(value)
+            else:
+                fields[key] = value
+
+        fields.setdefault('name', text)
+
+        if not any(key in fields for key in ('depth', 'movetime', 'nodes',
+                                             'agent')):
+            fields['movetime'] = 0.1
+
+        return cls(**fields)
+
+
+class GameTask(NamedTuple):
+    """
+    Everything a worker process needs to play one game
+    """
+
+    index: int
+    opening: str  # Fenstring the game starts from
+    white: EngineConfig
+    black: EngineConfig
+    max_plies: int
+
+
+class GameRecord(NamedTuple):
+    """
+    Outcome of one game sent back by a worker process
+    """
+
+    index: int
+    white: str  # Names of the configs
+    black: str
+    result: str  # PGN result, '1-0', '0-1' or '1/2-1/2'
+    termination: str
+    plies: int
+    pgn: str  # The game as PGN text
+
+
+def make_player(config: EngineConfig,
+                game: ChessGame) -> Callable[[ChessGame], int]:
+    """
+    Returns a function picking the move of a config in the current position
+    of a game
+    """
+
+    if config.agent is not None:
+        module, _, function = config.agent.partition(':')
+        return getattr(importlib.import_module(module), function)
+
+    searcher = Searcher(game, TranspositionTable(config.hash_size))
+
+    def search_move(game: ChessGame) -> int:
+        return searcher.search(config.depth or 64, config.movetime,
+                               config.nodes).best_move
+
+    return search_move
+
+def adjudicate(game: ChessGame, max_plies: int) -> Tuple[str, str]:
+    """
+    Returns the PGN result and the reason a game is over, ('*', '') while it
+    goes on
+    """
+
+    result = game_result(game)
+
+    if result != '*':
+        return result, 'checkmate' if result != '1/2-1/2' else 'stalemate'
+    if game.halfmove_clock >= 100:
+        return '1/2-1/2', 'fifty-move rule'
+    if game.is_repetition(2):
+        return '1/2-1/2', 'threefold repetition'
+    if game.is_insufficient_material():
+        return '1/2-1/2', 'insufficient material'
+    if len(game.history) >= max_plies:
+        return '1/2-1/2', 'adjudication'
+
+    return '*', ''
+
+def play_game(task: GameTask) -> GameRecord:
+    """
+    Plays one game of a match, runs in a worker process
+    """
+
+    game = ChessGame('bitboard')
+    game.load_fenstring(task.opening, gen_moves=False)
+
+    players = {1: make_player(task.white, game),
+               -1: make_player(task.black, game)}
+
+    while True:
+        result, termination = adjudicate(game, task.max_plies)
+        if result != '*':
+            break
+
+        legal_moves = game.legal_moves()
+        move = players[game.current_color](game)
+
+        # A search stopped before finishing a depth may return no move
+        if move not in legal_moves:
+            move = legal_moves[0]
+
+        game.make_move(move)
+
+    fenstring, sans = played_moves(game)
+
+    headers = {'Event': 'Match', 'Round': str(task.index + 1),
+               'White': task.white.name, 'Black': task.black.name,
+               'Termination': termination}
+
+    return GameRecord(task.index, task.white.name, task.black.name, result,
+                      termination, len(sans),
+                      format_pgn(headers, sans, result,
+                                 None if fenstring == default_opening
+                                 else fenstring))
+
+
+class MatchStats:
+    """
+    Running wins, draws and losses of the first engine of a match, with its
+    Elo difference and a sequential probability ratio test
+
+    The SPRT weighs Elo difference elo1 (the change is better) against elo0
+    (it is not), using the normal approximation of the game score
+    """
+
+    sprt_pseudo_count = 0.5  # Added to every result by llr and elo so one-sided matches still vary
+
+    wins: int
+    draws: int
+    losses: int
+
+    def __init__(self) -> None:
+        """
+        Constructor for the MatchStats class
+        """
+
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, record: GameRecord, name: str) -> None:
+        """
+        Counts a finished game from the point of view of the engine name
+        """
+
+        if record.result == '1/2-1/2':
+            self.draws += 1
+        elif (record.result == '1-0') == (record.white == name):
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def score(self, pseudo_count: float=0.0) -> Tuple[float, float]:
+        """
+        Returns the mean score per game and its variance
+
+        pseudo_count:float -> games added to each of wins, draws and losses,
+                              without them a match won or lost every game
+                              has no variance
+        """
+
+        wins = self.wins + pseudo_count
+        draws = self.draws + pseudo_count
+        losses = self.losses + pseudo_count
+        games = wins + draws + losses
+
+        score = (wins + 0.5 * draws) / games
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2
+                    + losses * score ** 2) / games
+
+        return score, variance
+
+    def elo(self, z: float=1.96) -> Tuple[float, float]:
+        """
+        Returns the Elo difference and the margin of its confidence interval,
+        95% by default
+        """
+
+        if not self.games:
+            return 0.0, math.inf
+
+        # The variance gets the pseudo-count of the SPRT, a match won or lost
+        # every game would otherwise have no margin at all
+        score = self.score()[0]
+        variance = self.score(self.sprt_pseudo_count)[1]
+        margin = z * math.sqrt(variance / self.games)
+
+        return (score_to_elo(score),
+                (score_to_elo(score + margin) - score_to_elo(score - margin))
+                / 2)
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        """
+        Returns the log-likelihood ratio of elo1 against elo0
+        """
+
+        if not self.games:
+            return 0.0
+
+        score, variance = self.score(self.sprt_pseudo_count)
+
+        score0, score1 = elo_to_score(elo0), elo_to_score(elo1)
+
+        return ((score1 - score0) * (2 * score - score0 - score1)
+                / (2 * variance / self.games))
+
+def score_to_elo(score: float) -> float:
+    """
+    Returns the Elo difference giving a mean score per game
+    """
+
+    score = min(max(score, 1e-6), 1 - 1e-6)
+
+    return -400 * math.log10(1 / score - 1)
+
+def elo_to_score(elo: float) -> float:
+    """
+    Returns the mean score per game of an Elo difference
+    """
+
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def sprt_bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    """
+    Returns the lower and upper LLR bounds of an SPRT with false positive
+    rate alpha and false negative rate beta
+    """
+
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def match_tasks(first: EngineConfig, second: EngineConfig, openings: List[str],
+                games: int, max_plies: int) -> Iterator[GameTask]:
+    """
+    Yields the games of a match, each opening is played twice with the
+    colors swapped
+    """
+
+    for index in range(games):
+        opening = openings[(index // 2) % len(openings)]
+
+        if index % 2 == 0:
+            yield GameTask(index, opening, first, second, max_plies)
+        else:
+            yield GameTask(index, opening, second, first, max_plies)
+
+def run_match(first: EngineConfig, second: EngineConfig, openings: List[str],
+              games: int, pgn_path: str=None, processes: int=None,
+              sprt: Tuple[float, float]=None, alpha: float=0.05,
+              beta: float=0.05, confidence: bool=False, max_plies: int=400,
+              min_games: int=20) -> MatchStats:
+    """
+    Plays a match between two configs over a process pool, printing the
+    standing after every game, and returns the stats of the first config
+
+    sprt:tuple -> (elo0, elo1), stop once the SPRT accepts either
+    confidence:bool -> stop once the 95% Elo interval excludes 0
+    min_games:int -> games played before either test may stop the match,
+                     the normal approximation is poor below it
+    """
+
+    if first.name == second.name:
+        raise ValueError('Both engines are named '
+                         f"'{first.name}', results could not be told apart")
+
+    stats = MatchStats()
+    lower, upper = sprt_bounds(alpha, beta)
+    start = time.perf_counter()
+
+    pgn_file = (open(pgn_path, 'a', encoding='utf-8')
+                if pgn_path is not None else None)
+
+    context = multiprocessing.get_context()
+    pool = context.Pool(processes)
+
+    try:
+        for record in pool.imap_unordered(
+                play_game, match_tasks(first, second, openings, games,
+                                       max_plies)):
+            stats.add(record, first.name)
+
+            if pgn_file is not None:
+                pgn_file.write(record.pgn)
+                pgn_file.flush()
+
+            elo, margin = stats.elo()
+            line = (f'Games {stats.games}: +{stats.wins} -{stats.losses} '
+                    f'={stats.draws}  Elo {elo:.1f} +/- {margin:.1f}')
+
+            stop = None
+
+            if sprt is not None:
+                llr = stats.llr(*sprt)
+                line += f'  LLR {llr:.2f} ({lower:.2f}, {upper:.2f})'
+
+                if llr >= upper:
+                    stop = f'SPRT accepted elo1 = {sprt[1]}'
+                elif llr <= lower:
+                    stop = f'SPRT accepted elo0 = {sprt[0]}'
+
+            if confidence and (elo - margin > 0 or elo + margin < 0):
+                stop = 'Elo interval excludes 0'
+
+            print(line, flush=True)
+
+            if stop is not None and stats.games >= min_games:
+                print(stop)
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+        if pgn_file is not None:
+            pgn_file.close()
+
+    elapsed = time.perf_counter() - start
+    print(f'{stats.games} games in {elapsed:.1f}s, '
+          f'{stats.games / max(elapsed, 1e-9):.2f} games/s')
+
+    return stats
+
+def read_openings(path: str) -> List[str]:
+    """
+    Returns the fenstrings of an EPD or FEN file, one position per line
+    """
+
+    return [fenstring for fenstring, operations in read_epd(path)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays two engine configs '
+                                     'against each other over every core')
+    parser.add_argument('first', type=EngineConfig.parse,
+                        help="engine being tested, e.g. 'name=new,depth=4'")
+    parser.add_argument('second', type=EngineConfig.parse,
+                        help="engine it is measured against, e.g. "
+                        "'name=base,movetime=0.05'")
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--openings', default=None,
+                        help='EPD or FEN file of starting positions, the '
+                        'standard starting position by default')
+    parser.add_argument('--pgn', default=None,
+                        help='file the games are appended to')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, one per core by default')
+    parser.add_argument('--sprt', type=float, nargs=2, default=None,
+                        metavar=('ELO0', 'ELO1'),
+                        help='stop once the SPRT of elo1 against elo0 ends')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--confidence', action='store_true',
+                        help='stop once the 95%% Elo interval excludes 0')
+    parser.add_argument('--max-plies', type=int, default=400,
+                        help='plies after which a game is drawn')
+    args = parser.parse_args()
+
+    openings = ([default_opening] if args.openings is None
+                else read_openings(args.openings))
+
+    run_match(args.first, args.second, openings, args.games, args.pgn,
+              args.processes, args.sprt, args.alpha, args.beta,
+              args.confidence, args.max_plies)
@@ -0,0 +1,158 @@
+import argparse
+import time
+
+from typing import Dict, List, Tuple
+
+from chess import ChessGame, move_name, starting_fenstring
+
+# Standard perft positions with their known leaf node counts for each depth
+perft_suite: List[Tuple[str, str, Dict[int, int]]] = [
+    ('start', starting_fenstring + ' w KQkq - 0 1',
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w '
+     'KQkq - 0 1', {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq '
+     '- 0 1', {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/'
+     'R4RK1 w - - 0 10', {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+]
+
+
+def perft(game: ChessGame, depth: int) -> int:
+    """
+    Counts the leaf nodes of the legal move tree of a game to a depth
+    """
+
+    if depth == 0:
+        return 1
+
+    moves = game.legal_moves()
+
+    # Leaves do not need to be played to be counted
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+
+    for move in moves:
+        game.make_move(move)
+        nodes += perft(game, depth - 1)
+        game.unmake_move()
+
+    return nodes
+
+def divide(game: ChessGame, depth: int) -> Dict[str, int]:
+    """
+    Returns the perft count below each legal move of a game
+    """
+
+    counts = {}
+
+    for move in game.legal_moves():
+        game.make_move(move)
+        counts[move_name(move)] = perft(game, depth - 1)
+        game.unmake_move()
+
+    return counts
+
+def run_perft(fen: str, depth: int, backend: str, show_divide: bool,
+              incremental: bool=False, verify_moves: bool=False) -> int:
+    """
+    Runs perft on one position, printing the node count and speed
+    """
+
+    game = ChessGame(backend, incremental=incremental,
+                     verify_moves=verify_moves)
+    game.load_fenstring(fen)
+
+    start = time.perf_counter()
+
+    if show_divide:
+        counts = divide(game, depth)
+
+        for name, count in sorted(counts.items()):
+            print(f'{name}: {count}')
+
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(game, depth)
+
+    elapsed = time.perf_counter() - start
+
+    print(f'Nodes: {nodes}  Time: {elapsed:.3f}s  '
+          f'Nodes/second: {nodes / max(elapsed, 1e-9):.0f}')
+
+    return nodes
+
+def run_suite(max_depth: int, backend: str, incremental: bool=False,
+              verify_moves: bool=False) -> bool:
+    """
+    Runs every position of perft_suite up to max_depth, returns a bool if
+    every count matched
+    """
+
+    passed = True
+    total_nodes = 0
+    start = time.perf_counter()
+
+    for name, fen, counts in perft_suite:
+        game = ChessGame(backend, incremental=incremental,
+                         verify_moves=verify_moves)
+        game.load_fenstring(fen)
+
+        for depth, expected in sorted(counts.items()):
+            if depth > max_depth:
+                break
+
+            depth_start = time.perf_counter()
+            nodes = perft(game, depth)
+            elapsed = time.perf_counter() - depth_start
+
+            total_nodes += nodes
+            result = 'ok' if nodes == expected else f'FAIL (expected {expected})'
+            passed = passed and nodes == expected
+
+            print(f'{name:<12} depth {depth}: {nodes:>9} {result}  '
+                  f'{nodes / max(elapsed, 1e-9):.0f} nodes/s')
+
+    elapsed = time.perf_counter() - start
+    print(f'Total: {total_nodes} nodes in {elapsed:.3f}s, '
+          f'{total_nodes / max(elapsed, 1e-9):.0f} nodes/s')
+
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Counts the leaf nodes of '
+                                     'the move tree to check and benchmark '
+                                     'move generation')
+    parser.add_argument('depth', type=int, nargs='?', default=3)
+    parser.add_argument('--fen', default=perft_suite[0][1])
+    parser.add_argument('--backend', choices=ChessGame.backends,
+                        default='pieces')
+    parser.add_argument('--divide', action='store_true',
+                        help='print the node count below each root move')
+    parser.add_argument('--suite', action='store_true',
+                        help='run the bundled positions with known counts up '
+                        'to depth')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only regenerate the moves of pieces each move '
+                        'can change, pieces backend only')
+    parser.add_argument('--verify-moves', action='store_true',
+                        help='check every incremental update against a full '
+                        'regeneration, implies --incremental')
+    args = parser.parse_args()
+
+    incremental = args.incremental or args.verify_moves
+
+    if args.suite:
+        if not run_suite(args.depth, args.backend, incremental,
+                         args.verify_moves):
+            raise SystemExit(1)
+    else:
+        run_perft(args.fen, args.depth, args.backend, args.divide,
+                  incremental, args.verify_moves)
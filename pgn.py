@@ -0,0 +1,413 @@
+import re
+
+from typing import Dict, Iterable, Iterator, List, NamedTuple, TextIO, Tuple
+
+from chess import ChessGame, parse_square, square_name, starting_fenstring
+from bitboard import PAWN, KING, encode_move
+
+# Piece letters of SAN by piece type, pawns have none
+san_letters = ['', 'N', 'B', 'R', 'Q', 'K']
+promotion_letters = ['', 'N', 'B', 'R', 'Q']  # By promotion piece type
+
+results = ('1-0', '0-1', '1/2-1/2', '*')
+
+# Tags every PGN game starts with, in order, with their unknown values
+seven_tag_roster = [('Event', '?'), ('Site', '?'), ('Date', '????.??.??'),
+                    ('Round', '?'), ('White', '?'), ('Black', '?'),
+                    ('Result', '*')]
+
+_header = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+# Comments, variation brackets, NAGs, move numbers and everything else
+_token = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|\(|\)|\d+\.+|[^\s{}();$]+')
+
+
+class PgnGame(NamedTuple):
+    """
+    One game read from a PGN file, moves are SAN strings of the main line
+    """
+
+    headers: Dict[str, str]
+    moves: List[str]
+    result: str
+
+
+def is_legal(game: ChessGame, move: int) -> bool:
+    """
+    Returns a bool if a pseudo-legal move of the side to move does not leave
+    its king in check
+    """
+
+    color = game.current_color
+
+    game.make_move(move)
+    legal = not game.in_check(color)
+    game.unmake_move()
+
+    return legal
+
+def move_san(game: ChessGame, move: int) -> str:
+    """
+    Returns a legal move of the side to move in SAN, e.g. 'Nbd7', 'exd8=Q+'
+    or 'O-O'
+    """
+
+    initial_pos = move & 63
+    final_pos = (move >> 6) & 63
+    promotion = move >> 12
+
+    board = game.board
+    piece_type = board[initial_pos].piece_type
+
+    if piece_type == KING and abs(final_pos - initial_pos) == 2:
+        san = 'O-O' if final_pos > initial_pos else 'O-O-O'
+    else:
+        capture = (board[final_pos].index != -1
+                   or (piece_type == PAWN and final_pos == game.en_passant))
+
+        if piece_type == PAWN:
+            san = square_name(initial_pos)[0] + 'x' if capture else ''
+        else:
+            san = san_letters[piece_type] + disambiguation(game, move)
+            if capture:
+                san += 'x'
+
+        san += square_name(final_pos)
+
+        if promotion:
+            san += '=' + promotion_letters[promotion]
+
+    color = game.current_color
+
+    game.make_move(move)
+
+    if game.in_check(-color):
+        san += '#' if not game.legal_moves() else '+'
+
+    game.unmake_move()
+
+    return san
+
+def disambiguation(game: ChessGame, move: int) -> str:
+    """
+    Returns the file, row or square a piece moves from when another piece of
+    the same type could also legally move to the same square, '' otherwise
+    """
+
+    initial_pos = move & 63
+    final_pos = (move >> 6) & 63
+    piece_type = game.board[initial_pos].piece_type
+
+    others = [other & 63 for other in game.get_moves()
+              if (other >> 6) & 63 == final_pos and other & 63 != initial_pos
+              and game.board[other & 63].piece_type == piece_type
+              and is_legal(game, other)]
+
+    if not others:
+        return ''
+
+    name = square_name(initial_pos)
+
+    if all(other % 8 != initial_pos % 8 for other in others):
+        return name[0]
+
+    if all(other // 8 != initial_pos // 8 for other in others):
+        return name[1]
+
+    return name
+
+def parse_san(game: ChessGame, san: str) -> int:
+    """
+    Returns the legal move of the side to move written in SAN, raises a
+    ValueError if it matches no legal move or more than one
+    """
+
+    text = san.rstrip('+#!?')
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        initial_pos = 60 if game.current_color == 1 else 4
+        final_pos = initial_pos + (2 if len(text) == 3 else -2)
+
+        candidates = [move for move in game.get_moves()
+                      if move == encode_move(initial_pos, final_pos)
+                      and game.board[initial_pos].piece_type == KING]
+    else:
+        promotion = 0
+
+        if '=' in text:
+            text, letter = text.split('=', 1)
+
+            if letter not in ('N', 'B', 'R', 'Q'):
+                raise ValueError(f"Invalid SAN move '{san}'")
+
+            promotion = promotion_letters.index(letter)
+        elif text[-1:] in ('N', 'B', 'R', 'Q') and text[-2:-1].isdigit():
+            # Promotion written without '=', e.g. 'e8Q'
+            promotion = promotion_letters.index(text[-1])
+            text = text[:-1]
+
+        piece_type = PAWN
+        if text[:1] in ('N', 'B', 'R', 'Q', 'K'):
+            piece_type = san_letters.index(text[0])
+            text = text[1:]
+
+        text = text.replace('x', '').replace('-', '')
+
+        if len(text) < 2:
+            raise ValueError(f"Invalid SAN move '{san}'")
+
+        final_pos = parse_square(text[-2:])
+        hint = text[:-2]  # Disambiguating file and/or row
+
+        candidates = []
+
+        for move in game.get_moves():
+            initial_pos = move & 63
+
+            if ((move >> 6) & 63 != final_pos or move >> 12 != promotion
+                    or game.board[initial_pos].piece_type != piece_type):
+                continue
+
+            name = square_name(initial_pos)
+            if all(char in (name[0] if char.isalpha() else name[1])
+                   for char in hint):
+                candidates.append(move)
+
+    candidates = [move for move in candidates if is_legal(game, move)]
+
+    if len(candidates) != 1:
+        raise ValueError(f"SAN move '{san}' matches {len(candidates)} legal "
+                         "moves")
+
+    return candidates[0]
+
+def iter_games(lines: Iterable[str]) -> Iterator[PgnGame]:
+    """
+    Yields each game of PGN text given line by line, e.g. an open file
+
+    Only one game is held in memory at a time. Comments, NAGs and variations
+    are skipped, moves are the SAN strings of the main line
+    """
+
+    headers = {}
+    movetext = []
+
+    for line in lines:
+        if line.startswith('%'):  # Escaped line
+            continue
+
+        stripped = line.strip()
+
+        if stripped.startswith('[') and not _in_comment(movetext):
+            # A tag after movetext starts the next game
+            if movetext:
+                yield _parse_game(headers, movetext)
+                headers = {}
+                movetext = []
+
+            match = _header.match(stripped)
+            if match:
+                headers[match.group(1)] = re.sub(r'\\(.)', r'\1',
+                                                 match.group(2))
+        elif stripped or movetext:
+            movetext.append(line)
+
+    if headers or any(line.strip() for line in movetext):
+        yield _parse_game(headers, movetext)
+
+def _in_comment(movetext: List[str]) -> bool:
+    """
+    Returns a bool if the movetext read so far ends inside a brace comment
+    """
+
+    if not movetext:
+        return False
+
+    text = ''.join(movetext)
+
+    return text.rfind('{') > text.rfind('}')
+
+def _parse_game(headers: Dict[str, str], movetext: List[str]) -> PgnGame:
+    """
+    Builds a PgnGame from its tags and the lines of its movetext
+    """
+
+    moves = []
+    result = headers.get('Result', '*')
+    depth = 0  # Variations being skipped
+
+    for token in _token.findall(''.join(movetext)):
+        first = token[0]
+
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth = max(depth - 1, 0)
+        elif depth or first in '{;$' or token[-1] == '.':
+            continue
+        elif token in results:
+            result = token
+        else:
+            moves.append(token.rstrip('!?'))
+
+    return PgnGame(headers, moves, result)
+
+def read_pgn(path: str) -> Iterator[PgnGame]:
+    """
+    Yields each game of a PGN file, streamed so files of any size can be
+    read in constant memory
+    """
+
+    with open(path, encoding='utf-8', errors='replace',
+              buffering=1 << 20) as file:
+        yield from iter_games(file)
+
+def replay(record: PgnGame, game: ChessGame=None) -> ChessGame:
+    """
+    Plays the moves of a PgnGame from its starting position, raises a
+    ValueError at the first move that is not legal
+
+    A new game on the bitboard backend is used unless one is passed in
+    """
+
+    if game is None:
+        game = ChessGame('bitboard')
+
+    game.load_fenstring(record.headers.get('FEN', starting_fenstring),
+                        gen_moves=False)
+
+    for ply, san in enumerate(record.moves):
+        try:
+            game.make_move(parse_san(game, san))
+        except ValueError as error:
+            raise ValueError(f'Ply {ply + 1} of game '
+                             f"{record.headers.get('Event', '?')}: "
+                             f'{error}') from None
+
+    return game
+
+def game_result(game: ChessGame) -> str:
+    """
+    Returns the PGN result of a game, '*' unless the side to move is mated
+    or stalemated
+    """
+
+    if game.legal_moves():
+        return '*'
+
+    if not game.in_check(game.current_color):
+        return '1/2-1/2'
+
+    return '0-1' if game.current_color == 1 else '1-0'
+
+def played_moves(game: ChessGame) -> Tuple[str, List[str]]:
+    """
+    Returns the fenstring a played game started from and its moves in SAN
+
+    Every move is taken back and then played again to name it from its own
+    position, the game is left as it was
+    """
+
+    moves = [record[0] for record in game.history]
+
+    for move in moves:
+        game.unmake_move()
+
+    fenstring = game.get_fenstring()
+    sans = []
+
+    for move in moves:
+        sans.append(move_san(game, move))
+        game.make_move(move)
+
+    return fenstring, sans
+
+def format_pgn(headers: Dict[str, str], moves: List[str], result: str,
+               fenstring: str=None, annotations: List[str]=None) -> str:
+    """
+    Returns a game as PGN text, movetext is wrapped at 80 characters
+
+    fenstring:str -> position the moves start from, also written as the
+                     FEN and SetUp tags
+    annotations:List[str] -> text written after each move, NAGs and
+                             comments such as '$2 {Best: Nf3}', '' for none
+    """
+
+    tags = {name: headers.get(name, default)
+            for name, default in seven_tag_roster}
+    tags['Result'] = result
+    tags.update((name, value) for name, value in headers.items()
+                if name not in tags)
+
+    color, number = 1, 1
+
+    if fenstring is not None:
+        fields = fenstring.split()
+        color = -1 if fields[1:2] == ['b'] else 1
+        number = int(fields[5]) if len(fields) > 5 else 1
+
+        tags['SetUp'] = '1'
+        tags['FEN'] = fenstring
+
+    lines = []
+
+    for name, value in tags.items():
+        value = value.replace('\\', '\\\\').replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+
+    lines.append('')
+
+    tokens = []
+
+    for ply, san in enumerate(moves):
+        if color == 1:
+            tokens.append(f'{number}.')
+        elif ply == 0:
+            tokens.append(f'{number}...')
+
+        tokens.append(san)
+
+        # Split on spaces so long comments wrap like everything else
+        if annotations is not None:
+            tokens.extend(annotations[ply].split())
+
+            # Black moves after a comment need their number again
+            if color == 1 and annotations[ply] and ply + 1 < len(moves):
+                tokens.append(f'{number}...')
+
+        if color == -1:
+            number += 1
+        color *= -1
+
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+
+    lines.append(line)
+
+    return '\n'.join(lines) + '\n\n'
+
+def write_pgn(file: TextIO, game: ChessGame, headers: Dict[str, str]=None,
+              result: str=None) -> None:
+    """
+    Appends a played game to an open PGN file
+
+    The result defaults to the one found on the board by game_result
+    """
+
+    fenstring, sans = played_moves(game)
+
+    if result is None:
+        result = game_result(game)
+
+    # The standard starting position is left out of the tags
+    if fenstring == starting_fenstring + ' w KQkq - 0 1':
+        fenstring = None
+
+    file.write(format_pgn(headers or {}, sans, result, fenstring))
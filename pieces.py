@@ -1,10 +1,7 @@
-import os
 import math
 
-import pygame
-
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, List
 
 
 def check_in_bounds(row: int, file: int):
@@ -27,10 +24,15 @@ class Piece(ABC):
     color_val: int  # Either -1 (Black), 0 (Colorless), or 1 (White)
     color_name: str  # String name corresponding to color_val
 
-    sprite_path: str
+    sprite_path: str  # File in res/ WindowManager draws the piece with
 
     moves: List[int]  # List of tiles a piece can legally move to
 
+    # Piece type and index (type + 6 for black) matching the ones used by
+    # bitboard.BitboardPosition, -1 for BlankPiece
+    piece_type: int
+    index: int
+
     color_name_map = {0:'Colorless', -1:'Black', 1:'White'}
 
     def __init__(self, pos:int, color:int) -> None:
@@ -41,21 +43,19 @@ class Piece(ABC):
         self.color_val = color
         self.color_name = self.color_name_map[color]
 
+        self.index = (self.piece_type + 6 if color == -1 
+                      else self.piece_type)
+
         self.moves = []
 
-    def load_sprite(self) -> None:
+    def set_pos(self, pos:int) -> None:
         """
-        Loads the sprite into the sprite variable based on sprite_path
+        Moves the piece to a new position on the board
         """
-        
-        self.sprite = pygame.image.load(os.path.join('res', self.sprite_path))
 
-    def scale_sprite(self, x_scale:int, y_scale:int) -> None:
-        """
-        Scales the sprite to a certain size
-        """
-        
-        self.sprite = pygame.transform.scale(self.sprite, (x_scale, y_scale))
+        self.pos = pos
+        self.row = pos // 8
+        self.file = pos % 8
 
     @abstractmethod
     def gen_legal_moves(self,  board:List) -> None:
@@ -70,6 +70,8 @@ class BlankPiece(Piece):
     """
     Placeholder class for empty tiles on the chessboard
     """
+
+    piece_type = -1
     
     def __init__(self, pos:int) -> None:
         super().__init__(pos, 0)  # Only class that is "Colorless"
@@ -77,9 +79,6 @@ class BlankPiece(Piece):
     def gen_legal_moves(self, board:List[Piece]) -> None:
         self.moves = []
 
-    def scale_sprite(self, x_scale: int, y_scale: int) -> None:
-        pass
-
 class Pawn(Piece):
     """
     Contains all code specific to the Pawn chess piece
@@ -88,10 +87,11 @@ class Pawn(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 0
+
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'Pawn.png'
-        self.load_sprite()
 
     def gen_legal_moves(self, board:List[Piece]) -> None:
         """
@@ -129,8 +129,9 @@ class Pawn(Piece):
             if 0 <= next_pos < 64:
                 next_piece:Piece = board[next_pos]
 
+                # File check stops captures wrapping around the board edge
                 if (next_piece.color_val == -self.color_val and 
-                        next_piece.row >= 0 and next_piece.row <= 7):
+                        abs(next_piece.file - self.file) == 1):
                     
                     self.moves.append(next_pos)
 
@@ -142,10 +143,11 @@ class Knight(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 1
+
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'Knight.png'
-        self.load_sprite()
 
     def gen_legal_moves(self, board:List[Piece]) -> None:
         """
@@ -182,10 +184,11 @@ class Bishop(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 2
+
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'Bishop.png'
-        self.load_sprite()
 
     def gen_legal_moves(self, board:List[Piece]) -> None:
         """
@@ -235,12 +238,13 @@ class Rook(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 3
+
     can_castle: bool
 
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'Rook.png'
-        self.load_sprite()
 
         self.can_castle = False
 
@@ -291,10 +295,11 @@ class Queen(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 4
+
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'Queen.png'
-        self.load_sprite()
 
     def gen_legal_moves(self, board:List[Piece]) -> None:
         """
@@ -343,7 +348,7 @@ class Queen(Piece):
             counter = 0
 
             collided = False
-            while not collided:
+            while not collided and counter < 7:
                 counter += 1
 
                 next_pos = self.pos + offset * counter
@@ -373,13 +378,14 @@ class King(Piece):
     color:int either -1 (Black) or 1 (White)
     """
 
+    piece_type = 5
+
     can_castle: bool
     castle_moves: List[int]
 
     def __init__(self, pos:int, color:int) -> None:
         super().__init__(pos, color)
         self.sprite_path = self.color_name + 'King.png'
-        self.load_sprite()
 
         self.can_castle = False
         self.castle_moves = []
@@ -392,6 +398,7 @@ class King(Piece):
         """
 
         self.moves.clear()
+        self.castle_moves = []  # Filled in by check_castle
 
         offsets = [-9, -8, -7, -1, 1, 7, 8, 9]
 
@@ -410,7 +417,16 @@ class King(Piece):
 
         # self.check_castle(board)
 
-    def check_castle(self, board:List[Piece]) -> None:
+    def check_castle(self, board:List[Piece],
+                     is_attacked: Callable[[int, int], bool]=None) -> None:
+        """
+        Fills in castle_moves, the squares the king can castle to
+
+        board:List[Piece] -> Snapshot of the current chessboard state
+        is_attacked:Callable -> ChessGame.is_attacked, when given the king
+                                may not castle out of, through or into check
+        """
+
         self.castle_moves = []
 
         if self.can_castle:
@@ -418,8 +434,19 @@ class King(Piece):
 
             for index, i in enumerate([-4, 3]):
                 castling_rook = board[self.pos + i]
-
-                if (castling_rook.can_castle and self.pos + 1 
-                    in castling_rook.moves or self.pos - 1 
-                        in castling_rook.moves):
-                    self.castle_moves.append(offsets[index] + self.pos)
+                next_pos = self.pos - 1 if i < 0 else self.pos + 1
+
+                # The rook reaching the empty tile next to the king means
+                # every tile between them is empty
+                if (type(castling_rook) == Rook and castling_rook.can_castle
+                        and castling_rook.color_val == self.color_val
+                        and next_pos in castling_rook.moves
+                        and type(board[next_pos]) == BlankPiece):
+                    final_pos = offsets[index] + self.pos
+
+                    if is_attacked is not None and any(
+                            is_attacked(pos, -self.color_val)
+                            for pos in (self.pos, next_pos, final_pos)):
+                        continue
+
+                    self.castle_moves.append(final_pos)
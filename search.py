@@ -0,0 +1,666 @@
+import argparse
+import multiprocessing
+import time
+
+from typing import Callable, List, NamedTuple, Optional
+
+from bitboard import CAPTURE_MOVES, PROMOTION_MOVES
+from chess import ChessGame, move_name
+from evaluation import PawnTable, evaluate
+from polyglot import OpeningBook
+from tablebase import Tablebases
+
+mate_score = 100000  # Score of giving mate right now, shorter mates score higher
+infinity = 1000000
+
+# Transposition table entry flags
+exact, lower_bound, upper_bound = 0, 1, 2
+
+
+class SearchResult(NamedTuple):
+    """
+    Outcome of a search, scores are in centipawns from the point of view of
+    the side to move
+    """
+
+    best_move: int
+    score: int
+    pv: List[int]  # Principal variation, the best line found
+    depth: int
+    nodes: int
+    time: float
+    nps: float  # Nodes searched per second
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of search results indexed by Zobrist key
+
+    When two positions share a slot the one searched deeper is kept, unless
+    the stored entry was left over from an earlier search
+    """
+
+    entries: List[Optional[tuple]]  # (key, depth, flag, score, move, generation)
+    mask: int  # Number of entries - 1, used to index the table with a key
+
+    generation: int  # Incremented every search so old entries can be replaced
+
+    def __init__(self, size: int=1 << 20) -> None:
+        """
+        Constructor for the TranspositionTable class
+
+        size:int -> number of entries, rounded down to a power of two
+        """
+
+        size = 1 << (size.bit_length() - 1)
+
+        self.entries = [None] * size
+        self.mask = size - 1
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """
+        Marks every stored entry as belonging to a previous search
+        """
+
+        self.generation += 1
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the table
+        """
+
+        self.entries = [None] * len(self.entries)
+
+    def probe(self, key: int) -> Optional[tuple]:
+        """
+        Returns the (key, depth, flag, score, move, generation) entry stored
+        for a key, None if there is none
+        """
+
+        entry = self.entries[key & self.mask]
+
+        if entry is not None and entry[0] == key:
+            return entry
+
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int,
+              move: int) -> None:
+        """
+        Stores a search result, replacing the entry in its slot if that one
+        was searched less deep, is from an older search or is the same
+        position
+        """
+
+        index = key & self.mask
+        entry = self.entries[index]
+
+        if (entry is None or entry[0] == key or depth >= entry[1]
+                or entry[5] != self.generation):
+            # Keep the known best move when a position is stored again
+            # without one
+            if not move and entry is not None and entry[0] == key:
+                move = entry[4]
+
+            self.entries[index] = (key, depth, flag, score, move,
+                                   self.generation)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    TranspositionTable kept in shared memory so several processes can search
+    with the same table
+
+    Every entry is two 64-bit words, the packed data and the key xor the
+    data. Processes write without locking, an entry torn by two processes
+    writing at once no longer matches its key and is ignored
+    """
+
+    def __init__(self, size: int=1 << 20) -> None:
+        """
+        Constructor for the SharedTranspositionTable class
+
+        size:int -> number of entries, rounded down to a power of two
+        """
+
+        size = 1 << (size.bit_length() - 1)
+
+        self.mask = size - 1
+        self.generation = 0
+
+        self.shared = multiprocessing.RawArray('Q', 2 * size)
+        self.words = memoryview(self.shared).cast('B').cast('Q')
+
+    def __getstate__(self) -> dict:
+        # The memoryview can not be pickled, the shared array can only be
+        # while a process is being started
+        return {'mask': self.mask, 'generation': self.generation,
+                'shared': self.shared}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.words = memoryview(self.shared).cast('B').cast('Q')
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the table
+        """
+
+        self.words.cast('B')[:] = bytes(len(self.words) * 8)
+
+    def probe(self, key: int) -> Optional[tuple]:
+        """
+        Returns the (key, depth, flag, score, move, generation) entry stored
+        for a key, None if there is none
+        """
+
+        index = (key & self.mask) << 1
+        data = self.words[index]
+
+        if data == 0 or self.words[index + 1] ^ data != key:
+            return None
+
+        return unpack_entry(key, data)
+
+    def store(self, key: int, depth: int, flag: int, score: int,
+              move: int) -> None:
+        """
+        Stores a search result with the same replacement rules as
+        TranspositionTable.store
+        """
+
+        index = (key & self.mask) << 1
+        data = self.words[index]
+
+        # Entries only keep the low 8 bits of the generation
+        generation = self.generation & 0xFF
+
+        if data != 0:
+            entry = unpack_entry(self.words[index + 1] ^ data, data)
+
+            if (entry[0] != key and depth < entry[1]
+                    and entry[5] == generation):
+                return
+
+            if not move and entry[0] == key:
+                move = entry[4]
+
+        data = ((move & 0x7FFF) | (depth & 0xFF) << 15 | flag << 23
+                | (score + score_offset) << 25 | generation << 46)
+
+        self.words[index] = data
+        self.words[index + 1] = key ^ data
+
+
+score_offset = 1 << 20  # Keeps packed scores positive
+
+def unpack_entry(key: int, data: int) -> tuple:
+    """
+    Unpacks a SharedTranspositionTable entry into the tuple returned by
+    TranspositionTable.probe
+    """
+
+    return (key, (data >> 15) & 0xFF, (data >> 23) & 3,
+            ((data >> 25) & 0x1FFFFF) - score_offset, data & 0x7FFF,
+            (data >> 46) & 0xFF)
+
+
+class Searcher:
+    """
+    Negamax alpha-beta search with iterative deepening, quiescence search and
+    a transposition table, played on a ChessGame with make_move/unmake_move
+    """
+
+    game: ChessGame
+    table: TranspositionTable
+    pawn_table: PawnTable  # Pawn structure scores of this searcher
+
+    nodes: int
+    stopped: bool  # Set once a time or node limit is hit
+    stop_requested: bool  # Set from another thread to end the search, see stop
+
+    workers: int  # Number of processes searching, helpers included
+    tablebases: Tablebases  # Endgame tables probed instead of searching, None without
+    stop_event: multiprocessing.Event  # Set to stop helper searches, None without helpers
+
+    killers: List[List[int]]  # Two quiet moves per ply that caused a cutoff
+    history_scores: List[int]  # Cutoff counts of quiet moves per color, from and to square
+
+    def __init__(self, game: ChessGame, table: TranspositionTable=None,
+                 workers: int=1, tablebases: Tablebases=None) -> None:
+        """
+        Constructor for the Searcher class
+
+        table:TranspositionTable -> table to use, shared between searches
+        workers:int -> processes to search with, more than one needs a
+                       SharedTranspositionTable which is created if no table
+                       is given
+        tablebases:Tablebases -> exact results for positions they cover
+        """
+
+        self.game = game
+        self.workers = workers
+        self.tablebases = tablebases
+
+        if table is None:
+            table = (SharedTranspositionTable() if workers > 1 
+                     else TranspositionTable())
+        elif workers > 1 and not isinstance(table, SharedTranspositionTable):
+            raise ValueError('Searching with several workers needs a '
+                             'SharedTranspositionTable')
+
+        self.table = table
+        self.pawn_table = PawnTable()
+        self.stop_event = None
+
+        self.nodes = 0
+        self.stopped = False
+        self.stop_requested = False
+
+        self.killers = []
+        self.history_scores = [0] * (2 * 64 * 64)
+
+        self._deadline = None
+        self._node_limit = None
+
+    def search(self, max_depth: int=64, time_limit: float=None,
+               node_limit: int=None,
+               on_iteration: Callable[[SearchResult], None]=None
+               ) -> SearchResult:
+        """
+        Searches the current position of the game with iterative deepening
+        until max_depth, time_limit seconds or node_limit nodes is reached
+
+        on_iteration is called with the result of every completed depth.
+        With more than one worker, helper processes search the same position
+        at staggered depths until this search finishes, sharing what they
+        find through the table (Lazy SMP)
+        """
+
+        self.table.new_search()
+
+        if self.workers == 1:
+            return self.iterate(1, max_depth, time_limit, node_limit,
+                                on_iteration)
+
+        context = multiprocessing.get_context()
+        self.stop_event = context.Event()
+        helper_nodes = context.Value('q', 0)
+
+        # Half of the helpers skip the first depth so they work ahead of the
+        # main search rather than repeating it, unless that is the only depth
+        helpers = [context.Process(target=_helper_search,
+                                   args=(self.game, self.table,
+                                         self.stop_event, helper_nodes,
+                                         min(1 + index % 2, max_depth),
+                                         max_depth,
+                                         self.tablebases),
+                                   daemon=True)
+                   for index in range(1, self.workers)]
+
+        for helper in helpers:
+            helper.start()
+
+        try:
+            result = self.iterate(1, max_depth, time_limit, node_limit,
+                                  on_iteration)
+        finally:
+            self.stop_event.set()
+
+            for helper in helpers:
+                helper.join()
+
+            self.stop_event = None
+
+        nodes = result.nodes + helper_nodes.value
+
+        return result._replace(nodes=nodes, nps=nodes / max(result.time, 1e-9))
+
+    def iterate(self, start_depth: int, max_depth: int, time_limit: float=None,
+                node_limit: int=None,
+                on_iteration: Callable[[SearchResult], None]=None
+                ) -> SearchResult:
+        """
+        Iterative deepening loop of search, searching every depth from
+        start_depth to max_depth until a limit is hit
+        """
+
+        start = time.perf_counter()
+
+        self.nodes = 0
+        self.stopped = False
+        self._deadline = start + time_limit if time_limit is not None else None
+        self._node_limit = node_limit
+
+        self.killers = [[0, 0] for ply in range(max_depth + 64)]
+        self.history_scores = [0] * (2 * 64 * 64)
+
+        result = None
+
+        for depth in range(start_depth, max_depth + 1):
+            pv = []
+            score = self.negamax(depth, -infinity, infinity, 0, pv)
+
+            # A partially searched depth is only trusted when nothing was
+            # completed before it
+            if self.stopped and result is not None:
+                break
+
+            elapsed = time.perf_counter() - start
+            result = SearchResult(pv[0] if pv else 0, score, pv, depth,
+                                  self.nodes, elapsed,
+                                  self.nodes / max(elapsed, 1e-9))
+
+            if on_iteration is not None:
+                on_iteration(result)
+
+            if self.stopped or not pv or abs(score) >= mate_score - depth:
+                break
+
+            # Another depth would not finish in the time left
+            if (self._deadline is not None
+                    and time.perf_counter() > start + time_limit / 2):
+                break
+
+        elapsed = time.perf_counter() - start
+
+        return result._replace(nodes=self.nodes, time=elapsed,
+                               nps=self.nodes / max(elapsed, 1e-9))
+
+    def stop(self) -> None:
+        """
+        Asks a search running on another thread to finish, it returns the
+        result of the depths it completed
+
+        stop_requested is not cleared by search, the caller clears it before
+        starting the next one
+        """
+
+        self.stop_requested = True
+
+    def check_limits(self) -> None:
+        """
+        Sets stopped once the time or node limit is reached or stop was
+        called
+        """
+
+        if self.stop_requested:
+            self.stopped = True
+        elif self._node_limit is not None and self.nodes >= self._node_limit:
+            self.stopped = True
+        elif (self._deadline is not None
+                and time.perf_counter() >= self._deadline):
+            self.stopped = True
+        elif self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int,
+                pv: List[int]) -> int:
+        """
+        Returns the score of the position searched to depth, filling pv with
+        the best line found
+        """
+
+        game = self.game
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        if self.stopped:
+            return 0
+
+        if ply > 0 and game.is_repetition():
+            return 0
+
+        if ply > 0 and self.tablebases is not None:
+            probe = self.tablebases.probe(game)
+
+            if probe is not None:
+                if probe.wdl == 0:
+                    return 0
+
+                # Mate scores as if the mate was found by searching
+                return probe.wdl * (mate_score - ply - probe.dtm)
+
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        key = game.zobrist_key
+        entry = self.table.probe(key)
+        tt_move = 0
+
+        if entry is not None:
+            tt_move = entry[4]
+
+            if entry[1] >= depth and ply > 0:
+                score = score_from_table(entry[3], ply)
+                flag = entry[2]
+
+                if (flag == exact or (flag == lower_bound and score >= beta)
+                        or (flag == upper_bound and score <= alpha)):
+                    return score
+
+        color = game.current_color
+        original_alpha = alpha
+        best_score = -infinity
+        best_move = 0
+        child_pv = []
+
+        searched = 0
+
+        # Moves are generated a stage at a time, after a cutoff the later
+        # stages are never generated
+        for move in game.staged_moves(tt_move, self.quiet_key(ply)):
+            searched += 1
+            game.make_move(move)
+
+            child_pv.clear()
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1, child_pv)
+
+            game.unmake_move()
+
+            if self.stopped:
+                return 0
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+
+                if score > alpha:
+                    alpha = score
+                    pv[:] = [move] + child_pv
+
+                    if score >= beta:
+                        self.record_cutoff(move, depth, ply)
+                        break
+
+        if not searched:
+            return -mate_score + ply if game.in_check(color) else 0
+
+        if best_score <= original_alpha:
+            flag = upper_bound
+        elif best_score >= beta:
+            flag = lower_bound
+        else:
+            flag = exact
+
+        self.table.store(key, depth, flag, score_to_table(best_score, ply),
+                         best_move)
+
+        return best_score
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """
+        Searches captures and promotions only until the position is quiet,
+        so the evaluation is not taken in the middle of an exchange
+        """
+
+        game = self.game
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        if self.stopped:
+            return 0
+
+        # The side to move can usually do at least as well as standing still
+        stand_pat = evaluate(game, self.pawn_table)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in game.staged_moves(kinds=CAPTURE_MOVES | PROMOTION_MOVES):
+            game.make_move(move)
+
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+
+            game.unmake_move()
+
+            if self.stopped:
+                return 0
+
+            if score > alpha:
+                alpha = score
+
+                if score >= beta:
+                    break
+
+        return alpha
+
+    def quiet_key(self, ply: int) -> Callable[[int], int]:
+        """
+        Returns the sort key of the quiet moves of a ply, its killer moves
+        first and the rest by their history score
+        """
+
+        killers = self.killers[ply]
+        history_base = 0 if self.game.current_color == 1 else 4096
+        history_scores = self.history_scores
+
+        def score(move: int) -> int:
+            if move == killers[0]:
+                return 1800000
+            if move == killers[1]:
+                return 1700000
+
+            return history_scores[history_base + (move & 4095)]
+
+        return score
+
+    def record_cutoff(self, move: int, depth: int, ply: int) -> None:
+        """
+        Remembers a quiet move that caused a beta cutoff in the killer and
+        history tables
+        """
+
+        board = self.game.board
+
+        if board[(move >> 6) & 63].color_val != 0 or move >> 12:
+            return
+
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        history_base = 0 if self.game.current_color == 1 else 4096
+        self.history_scores[history_base + (move & 4095)] += depth * depth
+
+
+def _helper_search(game: ChessGame, table: SharedTranspositionTable,
+                   stop_event: multiprocessing.Event,
+                   helper_nodes: multiprocessing.Value, start_depth: int,
+                   max_depth: int, tablebases: Tablebases=None) -> None:
+    """
+    Runs in a helper process of a Lazy SMP search, searching until the main
+    search sets stop_event and adding its node count to helper_nodes
+    """
+
+    searcher = Searcher(game, table, tablebases=tablebases)
+    searcher.stop_event = stop_event
+
+    try:
+        searcher.iterate(start_depth, max_depth)
+    finally:
+        with helper_nodes.get_lock():
+            helper_nodes.value += searcher.nodes
+
+
+def score_to_table(score: int, ply: int) -> int:
+    """
+    Stores mate scores relative to the position instead of the root
+    """
+
+    if score >= mate_score - 1000:
+        return score + ply
+    if score <= -mate_score + 1000:
+        return score - ply
+
+    return score
+
+def score_from_table(score: int, ply: int) -> int:
+    """
+    Converts a mate score from the table back to being relative to the root
+    """
+
+    if score >= mate_score - 1000:
+        return score - ply
+    if score <= -mate_score + 1000:
+        return score + ply
+
+    return score
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Searches a position for '
+                                     'the best move')
+    parser.add_argument('--fen', default=None,
+                        help='FEN to search, the starting position by '
+                        'default')
+    parser.add_argument('--depth', type=int, default=64)
+    parser.add_argument('--time', type=float, default=None,
+                        help='time limit in seconds')
+    parser.add_argument('--nodes', type=int, default=None)
+    parser.add_argument('--backend', choices=ChessGame.backends,
+                        default='bitboard')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to search with')
+    parser.add_argument('--book', default=None,
+                        help='Polyglot opening book to play from before '
+                        'searching')
+    parser.add_argument('--tablebases', default=None,
+                        help='directory of tables written by tablebase.py')
+    args = parser.parse_args()
+
+    if args.time is None and args.nodes is None and args.depth == 64:
+        args.time = 5.0
+
+    game = ChessGame(args.backend)
+    if args.fen is None:
+        game.load_fenstring()
+    else:
+        game.load_fenstring(args.fen)
+
+    if args.book is not None:
+        with OpeningBook(args.book) as book:
+            book_move = book.choose_move(game)
+
+        if book_move is not None:
+            print(f'bestmove {move_name(book_move)} (book)')
+            raise SystemExit
+
+    def print_iteration(result: SearchResult) -> None:
+        print(f'depth {result.depth} score {result.score} nodes '
+              f'{result.nodes} nps {result.nps:.0f} pv '
+              + ' '.join(move_name(move) for move in result.pv))
+
+    tablebases = (Tablebases(args.tablebases)
+                  if args.tablebases is not None else None)
+
+    result = Searcher(game, workers=args.workers,
+                      tablebases=tablebases).search(
+        args.depth, args.time, args.nodes, print_iteration)
+
+    print(f'bestmove {move_name(result.best_move)}')
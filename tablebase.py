@@ -0,0 +1,564 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+
+from itertools import product
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from chess import ChessGame
+from bitboard import (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BIT,
+                      KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks,
+                      bishop_attacks, castling_rights, iter_bits)
+
+# Material sets that can be generated, the pieces of the stronger side
+# against a lone king. Letters of a set go in the order of piece_order
+materials = ['KQK', 'KRK', 'KPK', 'KBNK']
+piece_order = 'QRBNP'
+
+piece_letters = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN}
+type_letters = {piece: letter for letter, piece in piece_letters.items()}
+
+# Tables that promotions of each pawn table lead into
+promotion_tables = {'KPK': {QUEEN: 'KQK', ROOK: 'KRK'}}
+
+file_suffix = '.cptb'
+_header = struct.Struct('<4s8sI')  # Magic, material, entries per side
+_magic = b'CPTB'
+
+
+def _transform(pos: int, swap: bool, flip_rank: bool, flip_file: bool) -> int:
+    """
+    Returns a square moved by one of the eight symmetries of the board
+    """
+
+    rank, file = 7 - pos // 8, pos % 8
+
+    if swap:
+        rank, file = file, rank
+    if flip_rank:
+        rank = 7 - rank
+    if flip_file:
+        file = 7 - file
+
+    return (7 - rank) * 8 + file
+
+# Every symmetry as a square lookup list, the identity first. Tables with
+# pawns can only be mirrored left to right
+symmetries = [[_transform(pos, *flags) for pos in range(64)]
+              for flags in product((False, True), repeat=3)]
+pawn_symmetries = [symmetries[0], symmetries[1]]
+
+# Squares the stronger king is moved onto, a1-d1-d4 without pawns and the
+# a to d files with them
+king_region = [pos for pos in range(64)
+               if 7 - pos // 8 <= pos % 8 <= 3]
+pawn_king_region = [pos for pos in range(64) if pos % 8 <= 3]
+
+
+class Probe(NamedTuple):
+    """
+    Tablebase result from the point of view of the side to move
+    """
+
+    wdl: int  # 1 win, 0 draw, -1 loss
+    dtm: int  # Plies until mate, 0 for draws
+
+
+class TableLayout:
+    """
+    Maps positions of one material set to indexes of its table
+
+    Pieces are ordered stronger king, the other pieces of the stronger side
+    as in the material name, then the lone king. Positions are turned by a
+    symmetry so the stronger king stands in its region, the index is built
+    from the squares in that order
+    """
+
+    material: str
+    pieces: List[int]  # Piece index of each square of a position
+    size: int  # Number of indexes for each side to move
+
+    def __init__(self, material: str) -> None:
+        """
+        Constructor for the TableLayout class
+
+        material:str -> name of the set, e.g. 'KBNK'
+        """
+
+        if (len(material) < 3 or material[0] != 'K' or material[-1] != 'K'
+                or any(letter not in piece_letters
+                       for letter in material[1:-1])):
+            raise ValueError(f"Invalid material '{material}'")
+
+        self.material = material
+        self.pieces = ([KING] + [piece_letters[letter]
+                                 for letter in material[1:-1]]
+                       + [KING + 6])
+
+        self.has_pawns = 'P' in material
+        region = pawn_king_region if self.has_pawns else king_region
+        table_symmetries = pawn_symmetries if self.has_pawns else symmetries
+
+        self.king_squares = region
+        self.king_slots = {pos: slot for slot, pos in enumerate(region)}
+
+        # Symmetries taking each square of the stronger king into the region
+        self.king_symmetries = [[symmetry for symmetry in table_symmetries
+                                 if symmetry[pos] in self.king_slots]
+                                for pos in range(64)]
+
+        # Symmetries other than the identity leaving a king square in place
+        self.fixing_symmetries = [[symmetry for symmetry in table_symmetries[1:]
+                                   if symmetry[pos] == pos]
+                                  for pos in range(64)]
+
+        self.size = len(region) * 64 ** (len(self.pieces) - 1)
+
+    def index(self, squares: List[int]) -> int:
+        """
+        Returns the index of the squares of a position, they have to be
+        turned into the region already
+        """
+
+        index = self.king_slots[squares[0]]
+
+        for pos in squares[1:]:
+            index = index * 64 + pos
+
+        return index
+
+    def canonical_index(self, squares: List[int]) -> int:
+        """
+        Returns the index of a position after turning it into the region
+
+        Positions with the king on a symmetry line can be turned in more than
+        one way, the smallest index is used so each has only one
+        """
+
+        best = -1
+
+        for symmetry in self.king_symmetries[squares[0]]:
+            index = self.king_slots[symmetry[squares[0]]]
+
+            for pos in squares[1:]:
+                index = index * 64 + symmetry[pos]
+
+            if best == -1 or index < best:
+                best = index
+
+        return best
+
+
+def white_attacks(pieces: List[int], squares: List[int],
+                  occupied: int) -> int:
+    """
+    Returns the squares attacked by the white pieces of a position
+    """
+
+    attacks = 0
+
+    for piece, pos in zip(pieces, squares):
+        if piece == KING:
+            attacks |= KING_ATTACKS[pos]
+        elif piece == KNIGHT:
+            attacks |= KNIGHT_ATTACKS[pos]
+        elif piece == PAWN:
+            attacks |= PAWN_ATTACKS[0][pos]
+        elif piece == BISHOP:
+            attacks |= bishop_attacks(pos, occupied)
+        elif piece == ROOK:
+            attacks |= rook_attacks(pos, occupied)
+        elif piece == QUEEN:
+            attacks |= (bishop_attacks(pos, occupied)
+                        | rook_attacks(pos, occupied))
+
+    return attacks
+
+def white_unmoves(piece: int, pos: int, occupied: int, black_king: int) -> int:
+    """
+    Returns the squares a white piece standing on pos could have moved from
+    """
+
+    if piece == KING:
+        return KING_ATTACKS[pos] & ~occupied & ~KING_ATTACKS[black_king]
+    if piece == KNIGHT:
+        return KNIGHT_ATTACKS[pos] & ~occupied
+    if piece == BISHOP:
+        return bishop_attacks(pos, occupied) & ~occupied
+    if piece == ROOK:
+        return rook_attacks(pos, occupied) & ~occupied
+    if piece == QUEEN:
+        return ((bishop_attacks(pos, occupied) | rook_attacks(pos, occupied))
+                & ~occupied)
+
+    # White pawns move towards row 0, they never stand on row 7
+    unmoves = 0
+
+    if pos // 8 < 6 and not occupied & BIT[pos + 8]:
+        unmoves |= BIT[pos + 8]
+
+        if pos // 8 == 4 and not occupied & BIT[pos + 16]:
+            unmoves |= BIT[pos + 16]
+
+    return unmoves
+
+def generate(material: str,
+             dependencies: Dict[str, Tuple[bytes, bytes]]=None
+             ) -> Tuple[bytearray, bytearray]:
+    """
+    Builds the tables of a material set by retrograde analysis, returns the
+    white to move and black to move tables
+
+    White is the stronger side. An entry is 0 for draws and illegal
+    positions, otherwise plies to mate + 1, a win for white to move and a
+    loss for black to move. Pawn tables need the tables their promotions
+    lead into in dependencies
+    """
+
+    layout = TableLayout(material)
+    pieces = layout.pieces
+    white_count = len(pieces) - 1
+    size = layout.size
+
+    white = bytearray(size)
+    black = bytearray(size)
+    white_legal = bytearray(size)
+    counts = bytearray(size)  # Legal moves of black not yet found lost
+
+    # Positions reaching their result at each ply, set when taken out
+    white_plies: Dict[int, List[int]] = {}
+    black_plies: Dict[int, List[int]] = {}
+
+    promotions = promotion_tables.get(material, {})
+    for table in promotions.values():
+        if dependencies is None or table not in dependencies:
+            raise ValueError(f'{material} needs the {table} table')
+
+    promotion_layouts = {piece: TableLayout(table)
+                         for piece, table in promotions.items()}
+
+    ranges = [layout.king_squares] + [range(64)] * white_count
+
+    for index, squares in enumerate(product(*ranges)):
+        black_king = squares[-1]
+
+        occupied = 0
+        for pos in squares:
+            occupied |= BIT[pos]
+
+        if (occupied.bit_count() != len(squares)
+                or KING_ATTACKS[squares[0]] & BIT[black_king]
+                or layout.canonical_index(squares) != index):
+            continue
+
+        if layout.has_pawns and any(piece == PAWN and pos // 8 in (0, 7)
+                                    for piece, pos in zip(pieces, squares)):
+            continue
+
+        attacks = white_attacks(pieces, squares, occupied ^ BIT[black_king])
+
+        # Captures of undefended pieces count, they leave the table as draws
+        moves = KING_ATTACKS[black_king] & ~attacks
+        counts[index] = moves.bit_count()
+
+        # With every white piece on a line of symmetry two moves can reach
+        # the same position, results are counted once per position reached
+        if counts[index] > 1 and any(
+                all(symmetry[pos] == pos for pos in squares[1:-1])
+                for symmetry in layout.fixing_symmetries[squares[0]]):
+            successors = set()
+
+            for pos in iter_bits(moves):
+                successors.add(-pos - 1 if occupied & BIT[pos] else
+                               layout.canonical_index(squares[:-1] + (pos, )))
+
+            counts[index] = len(successors)
+
+        if attacks & BIT[black_king]:
+            if not counts[index]:
+                black_plies.setdefault(0, []).append(index)
+            continue
+
+        white_legal[index] = 1
+
+        # Pawns promoting into a lost position of a bigger table
+        for i, (piece, pos) in enumerate(zip(pieces, squares)):
+            if piece != PAWN or pos // 8 != 1 or occupied & BIT[pos - 8]:
+                continue
+
+            for promotion, child_layout in promotion_layouts.items():
+                child = [squares[0]] + [pos - 8] + [squares[-1]]
+                plies = dependencies[promotions[promotion]][1][
+                    child_layout.canonical_index(child)]
+
+                if plies:
+                    white_plies.setdefault(plies, []).append(index)
+
+    ply = 0
+    last_ply = max(list(white_plies) + list(black_plies), default=0)
+
+    while ply <= last_ply:
+        # Black to move is lost at even plies, white to move wins at odd
+        for index in black_plies.pop(ply, []):
+            black[index] = ply + 1
+            squares = _squares(layout, index)
+            black_king = squares[-1]
+
+            occupied = 0
+            for pos in squares:
+                occupied |= BIT[pos]
+
+            for i in range(white_count):
+                pos = squares[i]
+
+                for origin in iter_bits(white_unmoves(pieces[i], pos,
+                                                      occupied, black_king)):
+                    squares[i] = origin
+                    parent = layout.canonical_index(squares)
+
+                    if white_legal[parent] and not white[parent]:
+                        white_plies.setdefault(ply + 1, []).append(parent)
+                        last_ply = max(last_ply, ply + 1)
+
+                squares[i] = pos
+
+        for index in white_plies.pop(ply, []):
+            if white[index]:
+                continue
+
+            white[index] = ply + 1
+            squares = _squares(layout, index)
+            black_king = squares[-1]
+
+            occupied = 0
+            for pos in squares:
+                occupied |= BIT[pos]
+
+            origins = (KING_ATTACKS[black_king] & ~occupied
+                       & ~KING_ATTACKS[squares[0]])
+            parents = set()
+
+            for origin in iter_bits(origins):
+                squares[-1] = origin
+                parents.add(layout.canonical_index(squares))
+
+            # Each parent counts this position once, see the move counts
+            for parent in parents:
+                counts[parent] -= 1
+                if not counts[parent]:
+                    black_plies.setdefault(ply + 1, []).append(parent)
+                    last_ply = max(last_ply, ply + 1)
+
+        ply += 1
+
+    return white, black
+
+def _squares(layout: TableLayout, index: int) -> List[int]:
+    """
+    Returns the squares of the position at an index of a layout
+    """
+
+    squares = []
+
+    for i in range(len(layout.pieces) - 1):
+        index, pos = divmod(index, 64)
+        squares.append(pos)
+
+    squares.append(layout.king_squares[index])
+    squares.reverse()
+
+    return squares
+
+def write_table(path: str, material: str, white: bytes, black: bytes) -> None:
+    """
+    Writes the tables of a material set to a file, a header followed by the
+    white to move and black to move entries
+    """
+
+    with open(path, 'wb') as file:
+        file.write(_header.pack(_magic, material.encode(), len(white)))
+        file.write(white)
+        file.write(black)
+
+def build_tables(directory: str, names: List[str]=materials) -> None:
+    """
+    Generates material sets into a directory, the tables pawn tables promote
+    into are generated first when missing
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    built: Dict[str, Tuple[bytes, bytes]] = {}
+
+    def build(material: str) -> None:
+        for table in promotion_tables.get(material, {}).values():
+            if table not in built:
+                build(table)
+
+        start = time.perf_counter()
+        built[material] = generate(material, built)
+        write_table(os.path.join(directory, material + file_suffix),
+                    material, *built[material])
+
+        print(f'{material}: {len(built[material][0])} entries per side in '
+              f'{time.perf_counter() - start:.1f}s')
+
+    for material in names:
+        if material not in built:
+            build(material)
+
+
+class Tablebases:
+    """
+    Generated tables of a directory, memory-mapped read only so they are
+    shared between processes and probed without loading them
+    """
+
+    directory: str
+    tables: Dict[str, tuple]  # Material to (layout, mapped file, entries per side)
+    max_pieces: int  # Positions with more pieces are never probed
+
+    def __init__(self, directory: str) -> None:
+        """
+        Constructor for the Tablebases class
+
+        directory:str -> where build_tables wrote the tables
+        """
+
+        self.directory = directory
+        self.tables = {}
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(file_suffix):
+                continue
+
+            with open(os.path.join(directory, name), 'rb') as file:
+                table_map = mmap.mmap(file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+
+            magic, material, size = _header.unpack_from(table_map)
+            if magic != _magic:
+                table_map.close()
+                raise ValueError(f"'{name}' is not a tablebase file")
+
+            material = material.rstrip(b'\0').decode()
+            self.tables[material] = (TableLayout(material), table_map, size)
+
+        # Lone minor pieces are known draws without a table
+        self.max_pieces = max([3] + [len(material)
+                                     for material in self.tables])
+
+    def __reduce__(self) -> tuple:
+        # Processes reopen the files instead of pickling the mappings
+        return (Tablebases, (self.directory, ))
+
+    def close(self) -> None:
+        """
+        Unmaps every table
+        """
+
+        for layout, table_map, size in self.tables.values():
+            table_map.close()
+
+        self.tables.clear()
+
+    def probe(self, game: ChessGame) -> Optional[Probe]:
+        """
+        Returns the result of the position of a game, None when it is not
+        covered by the tables
+        """
+
+        if game.position is not None:
+            occupancy = game.position.occupancy
+            if (occupancy[0] | occupancy[1]).bit_count() > self.max_pieces:
+                return None
+
+        white, black = [], []
+
+        for piece in game.board:
+            if piece.index != -1:
+                (white if piece.color_val == 1 else black).append(piece)
+
+                if len(white) + len(black) > self.max_pieces:
+                    return None
+
+        # The stronger side is always white in the tables
+        strong_color = 1 if len(white) >= len(black) else -1
+        strong, weak = (white, black) if strong_color == 1 else (black, white)
+
+        if len(weak) != 1:
+            return None
+
+        king = [piece for piece in strong if piece.piece_type == KING]
+        others = sorted((piece for piece in strong
+                         if piece.piece_type != KING),
+                        key=lambda piece: piece_order.index(
+                            type_letters[piece.piece_type]))
+        letters = ''.join(type_letters[piece.piece_type] for piece in others)
+        material = 'K' + letters + 'K'
+
+        if len(king) != 1:
+            return None
+
+        if material not in self.tables:
+            # A lone minor piece can not mate
+            if letters in ('', 'B', 'N'):
+                return Probe(0, 0)
+            return None
+
+        if castling_rights(game.board):
+            return None
+
+        layout, table_map, size = self.tables[material]
+
+        # Black as the stronger side is mirrored onto white
+        squares = [piece.pos for piece in king + others + weak]
+        if strong_color == -1:
+            squares = [pos ^ 56 for pos in squares]
+
+        strong_to_move = game.current_color == strong_color
+        offset = _header.size + layout.canonical_index(squares)
+        value = table_map[offset if strong_to_move else offset + size]
+
+        if not value:
+            return Probe(0, 0)
+
+        return Probe(1 if strong_to_move else -1, value - 1)
+
+    def best_move(self, game: ChessGame) -> Optional[int]:
+        """
+        Returns the legal move with the best result for the side to move,
+        the quickest mate when winning and the longest defence when losing.
+        None when the position or one of its moves is not covered
+        """
+
+        best_move, best_score = None, None
+
+        for move in game.legal_moves():
+            game.make_move(move)
+            probe = self.probe(game)
+            game.unmake_move()
+
+            if probe is None:
+                return None
+
+            # Results of the moves are from the point of view of the opponent
+            score = -probe.wdl * (1000 - probe.dtm) if probe.wdl else 0
+
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+
+        return best_move
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates endgame '
+                                     'tablebases by retrograde analysis')
+    parser.add_argument('directory', help='where to write the tables')
+    parser.add_argument('materials', nargs='*', default=materials,
+                        help=f"material sets to generate, {' '.join(materials)} "
+                        'by default')
+    args = parser.parse_args()
+
+    build_tables(args.directory, args.materials)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from chess import ChessGame
+from training_data import ShardWriter, ShardDataset, move_masks
+
+
+positions = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+]
+
+
+def test_move_masks_match_game_move_mask(tmp_path):
+    games = []
+
+    with ShardWriter(str(tmp_path)) as writer:
+        for fenstring in positions:
+            game = ChessGame('bitboard', observations=True)
+            game.load_fenstring(fenstring)
+            games.append(game)
+
+            writer.add_position(game, game.legal_moves()[0])
+            writer.end_game('1/2-1/2')
+
+    masks = move_masks(ShardDataset(str(tmp_path)).batch(np.arange(len(games))))
+
+    for game, mask in zip(games, masks):
+        assert (mask == game.move_mask.reshape(-1)).all()
@@ -0,0 +1,360 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+
+from typing import List, Optional
+
+from chess import ChessGame, starting_fenstring
+from pgn import PgnGame, parse_san, read_pgn
+
+max_legal_moves = 218  # Most legal moves any chess position has
+
+# One training sample, a position with its legal moves, the move chosen and
+# how the game ended. Records are packed so a shard is just records back to
+# back and opens as a numpy.memmap of this dtype
+record_dtype = np.dtype([
+    ('squares', np.uint8, 64),  # Piece codes as in CompactPosition, 0 for empty squares
+    ('side', np.int8),  # color_val of the side to move
+    ('castling', np.uint8),  # Castling rights bits
+    ('ep_square', np.int8),  # Square a pawn can capture en passant onto, -1 if none
+    ('halfmove_clock', np.uint16),
+    ('fullmove_number', np.uint16),
+    ('move', np.uint16),  # Move played, encoded with bitboard.encode_move
+    ('outcome', np.int8),  # 1 if the side to move went on to win, 0 for a draw, -1 for a loss
+    ('legal_count', np.uint8),
+    ('legal_moves', np.uint16, max_legal_moves),  # Encoded legal moves, the first legal_count are used
+])
+
+shard_pattern = 'shard-{:05d}.bin'
+
+
+class ShardWriter:
+    """
+    Appends training samples to fixed size binary shards in a directory
+
+    Positions of the game being played are held back until end_game gives
+    their outcome, then copied into a buffer written out in large blocks.
+    New shards are numbered after those already in the directory, so a
+    directory can be added to over many runs
+    """
+
+    directory: str
+    records_per_shard: int
+
+    shard_index: int  # Number of the shard being written
+    shard_records: int  # Records written to it so far
+    records: int  # Records written by this writer
+
+    _file: object  # Open shard, None before the first write
+    _buffer: np.ndarray  # Records waiting to be written
+    _buffered: int
+    _pending: List[tuple]  # Positions of the current game without an outcome
+
+    def __init__(self, directory: str, records_per_shard: int=1 << 20,
+                 buffer_size: int=4096) -> None:
+        """
+        Constructor for the ShardWriter class
+
+        records_per_shard:int -> records in every shard but the last, 1 << 20
+                                 records is about 512MB
+        buffer_size:int -> records gathered before a write
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.records_per_shard = records_per_shard
+
+        # One past the highest shard, counting them would reuse a number
+        # when an earlier shard was deleted
+        paths = shard_paths(directory)
+        self.shard_index = shard_number(paths[-1]) + 1 if paths else 0
+        self.shard_records = 0
+        self.records = 0
+
+        self._file = None
+        self._buffer = np.zeros(buffer_size, dtype=record_dtype)
+        self._buffered = 0
+        self._pending = []
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_position(self, game: ChessGame, move: int,
+                     legal_moves: List[int]=None) -> None:
+        """
+        Records the current position of a game and the move about to be
+        played in it, the legal moves are generated unless passed in
+        """
+
+        if legal_moves is None:
+            legal_moves = game.legal_moves()
+
+        position = game.compact()
+
+        self._pending.append((position, move, legal_moves))
+
+    def end_game(self, result: str) -> None:
+        """
+        Gives the positions added since the last game their outcome from a
+        PGN result and queues them for writing, an unfinished game ('*') is
+        dropped
+        """
+
+        pending = self._pending
+        self._pending = []
+
+        if result == '*':
+            return
+
+        winner = {'1-0': 1, '0-1': -1, '1/2-1/2': 0}[result]
+
+        for position, move, legal_moves in pending:
+            if self._buffered == len(self._buffer):
+                self.flush()
+
+            record = self._buffer[self._buffered]
+            self._buffered += 1
+
+            record['squares'] = np.frombuffer(position.squares, dtype=np.uint8)
+            record['side'] = position.side
+            record['castling'] = position.castling
+            record['ep_square'] = position.ep_square
+            record['halfmove_clock'] = position.halfmove_clock
+            record['fullmove_number'] = position.fullmove_number
+            record['move'] = move
+            record['outcome'] = winner * position.side
+            record['legal_count'] = len(legal_moves)
+            record['legal_moves'][:len(legal_moves)] = legal_moves
+            record['legal_moves'][len(legal_moves):] = 0
+
+    def add_played_game(self, game: ChessGame, result: str) -> None:
+        """
+        Records every position of a finished game from its undo records, the
+        game is left as it was
+        """
+
+        moves = [record[0] for record in game.history]
+
+        for move in moves:
+            game.unmake_move()
+
+        for move in moves:
+            self.add_position(game, move)
+            game.make_move(move)
+
+        self.end_game(result)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records out, starting new shards as they fill up
+        """
+
+        records = self._buffer[:self._buffered]
+
+        while len(records):
+            if self._file is None or self.shard_records == self.records_per_shard:
+                self._open_next_shard()
+
+            count = min(len(records), self.records_per_shard - self.shard_records)
+            self._file.write(records[:count].tobytes())
+
+            self.shard_records += count
+            self.records += count
+            records = records[count:]
+
+        self._buffered = 0
+
+    def _open_next_shard(self) -> None:
+        """
+        Closes the shard being written and creates the next one
+        """
+
+        if self._file is not None:
+            self._file.close()
+            self.shard_index += 1
+
+        path = os.path.join(self.directory,
+                            shard_pattern.format(self.shard_index))
+
+        self._file = open(path, 'wb')
+        self.shard_records = 0
+
+    def close(self) -> None:
+        """
+        Writes everything buffered and closes the shard, positions of an
+        unfinished game are dropped
+        """
+
+        self._pending = []
+        self.flush()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def shard_paths(directory: str) -> List[str]:
+    """
+    Returns the shard files of a directory in the order they were written
+    """
+
+    return sorted(glob.glob(os.path.join(directory, 'shard-*.bin')))
+
+def shard_number(path: str) -> int:
+    """
+    Returns the number of a shard from its file name
+    """
+
+    return int(os.path.basename(path)[len('shard-'):-len('.bin')])
+
+def open_shard(path: str) -> np.memmap:
+    """
+    Opens a shard as a read only memmap of records, nothing is read until
+    records are indexed
+    """
+
+    return np.memmap(path, dtype=record_dtype, mode='r')
+
+
+class ShardDataset:
+    """
+    Every record of a directory of shards, indexed as one array for random
+    access batching
+    """
+
+    shards: List[np.memmap]
+    offsets: np.ndarray  # Index of the first record of each shard, then the total
+
+    def __init__(self, directory: str) -> None:
+        """
+        Constructor for the ShardDataset class, empty shards are skipped
+        """
+
+        self.shards = [open_shard(path) for path in shard_paths(directory)
+                       if os.path.getsize(path)]
+        self.offsets = np.concatenate(
+            [[0], np.cumsum([len(shard) for shard in self.shards])]
+        ).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def batch(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns the records at dataset indices as a structured array
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+
+        records = np.empty(len(indices), dtype=record_dtype)
+
+        for shard_id in np.unique(shard_ids):
+            selected = shard_ids == shard_id
+            records[selected] = self.shards[shard_id][
+                indices[selected] - self.offsets[shard_id]]
+
+        return records
+
+    def sample(self, batch_size: int,
+               generator: np.random.Generator=None) -> np.ndarray:
+        """
+        Returns batch_size records picked uniformly at random
+        """
+
+        if generator is None:
+            generator = np.random.default_rng()
+
+        return self.batch(generator.integers(0, len(self), batch_size))
+
+
+def piece_planes(records: np.ndarray) -> np.ndarray:
+    """
+    Returns (N, 12, 8, 8) uint8 piece planes of records, laid out like
+    ChessGame.planes
+    """
+
+    codes = records['squares'].reshape(-1, 1, 8, 8)
+
+    return (codes == np.arange(1, 13, dtype=np.uint8).reshape(1, 12, 1, 1)
+            ).astype(np.uint8)
+
+def move_masks(records: np.ndarray) -> np.ndarray:
+    """
+    Returns (N, 4096) bool legal action masks of records, laid out like
+    BatchChessEnv masks (initial_pos * 64 + final_pos)
+    """
+
+    masks = np.zeros((len(records), 4096), dtype=bool)
+    used = (np.arange(max_legal_moves)
+            < records['legal_count'][:, None].astype(np.int64))
+
+    rows = np.broadcast_to(np.arange(len(records))[:, None], used.shape)
+    moves = records['legal_moves'].astype(np.int64)
+
+    masks[rows[used], ((moves & 63) * 64 + ((moves >> 6) & 63))[used]] = True
+
+    return masks
+
+
+def export_pgn_game(writer: ShardWriter, record: PgnGame,
+                    game: ChessGame=None) -> Optional[int]:
+    """
+    Replays a game read from a PGN file into the writer, returns the number
+    of positions recorded or None if the game has no result or an illegal
+    move
+    """
+
+    if record.result == '*':
+        return None
+
+    if game is None:
+        game = ChessGame('bitboard')
+
+    game.load_fenstring(record.headers.get('FEN', starting_fenstring),
+                        gen_moves=False)
+
+    for san in record.moves:
+        legal_moves = game.legal_moves()
+
+        try:
+            move = parse_san(game, san)
+        except ValueError:
+            writer.end_game('*')
+            return None
+
+        writer.add_position(game, move, legal_moves)
+        game.make_move(move)
+
+    writer.end_game(record.result)
+
+    return len(record.moves)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports the positions of '
+                                     'PGN games to binary training shards')
+    parser.add_argument('directory', help='directory the shards are added to')
+    parser.add_argument('pgn', nargs='+', help='PGN files to export')
+    parser.add_argument('--records-per-shard', type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    game = ChessGame('bitboard')
+    games = skipped = 0
+
+    with ShardWriter(args.directory, args.records_per_shard) as writer:
+        for path in args.pgn:
+            for record in read_pgn(path):
+                if export_pgn_game(writer, record, game) is None:
+                    skipped += 1
+                else:
+                    games += 1
+
+    print(f'{writer.records} positions from {games} games written to '
+          f'{args.directory}, {skipped} games skipped')
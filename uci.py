@@ -0,0 +1,381 @@
+import argparse
+import sys
+import threading
+
+from typing import List, Optional, TextIO
+
+from chess import ChessGame, move_name, starting_fenstring
+from polyglot import OpeningBook
+from search import (Searcher, SearchResult, TranspositionTable,
+                    SharedTranspositionTable, mate_score)
+from tablebase import Tablebases
+
+engine_name = 'Chess-py'
+engine_author = 'HiIamturtle'
+
+move_overhead = 0.05  # Seconds kept back from every move for the interface
+
+
+def parse_move(game: ChessGame, text: str) -> int:
+    """
+    Returns the legal move written in coordinate notation, e.g. 'e2e4' or
+    'e7e8q', raises a ValueError if there is none
+    """
+
+    for move in game.legal_moves():
+        if move_name(move) == text:
+            return move
+
+    raise ValueError(f"Illegal move '{text}' in position "
+                     f"'{game.get_fenstring()}'")
+
+def format_score(score: int) -> str:
+    """
+    Returns a search score as the score field of an info line, 'cp 35' or
+    'mate -3' counting moves rather than plies
+    """
+
+    if abs(score) >= mate_score - 1000:
+        plies = mate_score - abs(score)
+        moves = (plies + 1) // 2
+
+        return f'mate {moves if score > 0 else -moves}'
+
+    return f'cp {score}'
+
+def time_budget(remaining: float, increment: float=0.0,
+                moves_to_go: int=None) -> float:
+    """
+    Returns the seconds to think about a move given the time left on the
+    clock, the increment and the moves until the next time control
+    """
+
+    moves_to_go = moves_to_go or 30
+
+    budget = remaining / moves_to_go + increment * 0.8
+
+    # Never risk the clock, whatever the increment
+    return max(min(budget, remaining * 0.5 - move_overhead), 0.01)
+
+
+class UciEngine:
+    """
+    Speaks the Universal Chess Interface over text streams so the engine can
+    be driven by tournament managers and GUIs
+
+    Searches run on a worker thread, the input is still read while thinking
+    so stop and isready are answered straight away. Other commands wait for
+    the search to finish first
+    """
+
+    game: ChessGame
+    searcher: Searcher
+    output: TextIO
+
+    book: OpeningBook  # None unless the BookFile option is set
+    tablebases: Tablebases  # None unless the TablebasePath option is set
+    workers: int  # Processes to search with, the Threads option
+
+    _thread: threading.Thread  # Thread of the running search, None when idle
+    _stopped: threading.Event  # Set by stop, ends go infinite
+    _infinite: bool  # The running search only ends on stop
+    _lock: threading.Lock  # Keeps lines written from both threads whole
+
+    def __init__(self, output: TextIO=sys.stdout, workers: int=1,
+                 book_path: str=None, tablebase_path: str=None) -> None:
+        """
+        Constructor for the UciEngine class
+
+        output:TextIO -> stream the engine writes its lines to
+        """
+
+        self.output = output
+        self.workers = workers
+
+        self.book = OpeningBook(book_path) if book_path else None
+        self.tablebases = Tablebases(tablebase_path) if tablebase_path else None
+
+        self.game = ChessGame('bitboard')
+        self.game.load_fenstring(gen_moves=False)
+
+        self.searcher = self.new_searcher()
+
+        self._thread = None
+        self._stopped = threading.Event()
+        self._infinite = False
+        self._lock = threading.Lock()
+
+    def new_searcher(self) -> Searcher:
+        """
+        Returns a Searcher of the current game with an empty table
+        """
+
+        table = (SharedTranspositionTable() if self.workers > 1
+                 else TranspositionTable())
+
+        return Searcher(self.game, table, self.workers, self.tablebases)
+
+    def send(self, line: str) -> None:
+        """
+        Writes one line to the interface
+        """
+
+        with self._lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line: str) -> bool:
+        """
+        Runs one command sent by the interface, returns False once it sent
+        quit
+
+        Unknown commands are ignored as the protocol asks
+        """
+
+        tokens = line.split()
+
+        if not tokens:
+            return True
+
+        command, arguments = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {engine_name}')
+            self.send(f'id author {engine_author}')
+            self.send('option name Threads type spin default 1 min 1 max 64')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.wait()
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.wait()
+            self.searcher = self.new_searcher()
+        elif command == 'position':
+            self.wait()
+
+            try:
+                self.set_position(arguments)
+            except ValueError as error:
+                self.send(f'info string {error}')
+        elif command == 'go':
+            self.wait()
+            self.go(arguments)
+        elif command == 'stop':
+            self.wait(stop=True)
+        elif command == 'quit':
+            self.wait(stop=True)
+            self.close()
+            return False
+
+        return True
+
+    def set_option(self, arguments: List[str]) -> None:
+        """
+        Handles 'setoption name <name> [value <value>]'
+        """
+
+        text = ' '.join(arguments)
+
+        if not text.startswith('name '):
+            return
+
+        name, _, value = text[5:].partition(' value ')
+        name = name.strip().lower()
+        value = value.strip()
+
+        if value == '<empty>':
+            value = ''
+
+        if name == 'threads':
+            self.workers = max(int(value), 1)
+            self.searcher = self.new_searcher()
+        elif name == 'bookfile':
+            if self.book is not None:
+                self.book.close()
+            self.book = OpeningBook(value) if value else None
+        elif name == 'tablebasepath':
+            if self.tablebases is not None:
+                self.tablebases.close()
+            self.tablebases = Tablebases(value) if value else None
+            self.searcher.tablebases = self.tablebases
+
+    def set_position(self, arguments: List[str]) -> None:
+        """
+        Handles 'position startpos|fen <fen> [moves <move> ...]', raises a
+        ValueError for a bad FEN or move and keeps the previous position
+        """
+
+        if 'moves' in arguments:
+            split = arguments.index('moves')
+            arguments, moves = arguments[:split], arguments[split + 1:]
+        else:
+            moves = []
+
+        if arguments[:1] == ['fen']:
+            fenstring = ' '.join(arguments[1:])
+        else:
+            fenstring = starting_fenstring + ' w KQkq - 0 1'
+
+        # Played on a scratch game first, the searcher's game is only changed
+        # once everything is known to be legal
+        for game in [ChessGame('bitboard'), self.game]:
+            game.load_fenstring(fenstring, gen_moves=False)
+
+            for text in moves:
+                game.make_move(parse_move(game, text))
+
+    def go(self, arguments: List[str]) -> None:
+        """
+        Handles 'go' with depth, nodes, movetime, wtime/btime, winc/binc,
+        movestogo and infinite, starting the search on a worker thread
+        """
+
+        limits = {}
+        infinite = False
+
+        for i, token in enumerate(arguments):
+            if token == 'infinite':
+                infinite = True
+            elif i + 1 < len(arguments) and arguments[i + 1].lstrip('-').isdigit():
+                limits[token] = int(arguments[i + 1])
+
+        max_depth = limits.get('depth', 64)
+        node_limit = limits.get('nodes')
+        time_limit = None
+
+        if 'movetime' in limits:
+            time_limit = max(limits['movetime'] / 1000 - move_overhead, 0.01)
+        else:
+            side = 'w' if self.game.current_color == 1 else 'b'
+
+            if side + 'time' in limits:
+                time_limit = time_budget(limits[side + 'time'] / 1000,
+                                         limits.get(side + 'inc', 0) / 1000,
+                                         limits.get('movestogo'))
+
+        if infinite:
+            max_depth, node_limit, time_limit = 64, None, None
+
+        book_move = self.book_move()
+        if book_move is not None and not infinite:
+            self.send(f'bestmove {move_name(book_move)}')
+            return
+
+        self.searcher.stop_requested = False
+        self._stopped.clear()
+        self._infinite = infinite
+        self._thread = threading.Thread(
+            target=self.think,
+            args=(max_depth, time_limit, node_limit, infinite), daemon=True)
+        self._thread.start()
+
+    def book_move(self) -> Optional[int]:
+        """
+        Returns a move of the opening book for the current position, None
+        without a book or when the position is not in it
+        """
+
+        if self.book is None:
+            return None
+
+        return self.book.choose_move(self.game)
+
+    def think(self, max_depth: int, time_limit: Optional[float],
+              node_limit: Optional[int], infinite: bool=False) -> None:
+        """
+        Runs a search on the worker thread, sending an info line for every
+        completed depth and the best move at the end
+
+        infinite:bool -> hold the best move back until stop, even if the
+                         search ends on its own
+        """
+
+        legal_moves = self.game.legal_moves()
+
+        if legal_moves:
+            result = self.searcher.search(max_depth, time_limit, node_limit,
+                                          self.send_info)
+
+        if infinite:
+            self._stopped.wait()
+
+        if not legal_moves:
+            self.send('bestmove 0000')
+            return
+
+        best_move = result.best_move
+        if best_move not in legal_moves:
+            best_move = legal_moves[0]
+
+        self.send(f'bestmove {move_name(best_move)}')
+
+    def send_info(self, result: SearchResult) -> None:
+        """
+        Sends the info line of a completed depth
+        """
+
+        self.send(f'info depth {result.depth} score {format_score(result.score)} '
+                  f'nodes {result.nodes} nps {result.nps:.0f} '
+                  f'time {result.time * 1000:.0f} pv '
+                  + ' '.join(move_name(move) for move in result.pv))
+
+    def wait(self, stop: bool=False) -> None:
+        """
+        Waits for a running search to send its best move
+
+        stop:bool -> end the search now instead of letting it reach its
+                     limits, a go infinite search is always ended
+        """
+
+        if self._thread is None:
+            return
+
+        if stop or self._infinite:
+            self.searcher.stop()
+            self._stopped.set()
+
+        self._thread.join()
+        self._thread = None
+
+    def close(self) -> None:
+        """
+        Closes the opening book and tablebases
+        """
+
+        if self.book is not None:
+            self.book.close()
+        if self.tablebases is not None:
+            self.tablebases.close()
+
+    def run(self, lines: TextIO=sys.stdin) -> None:
+        """
+        Handles commands line by line until quit or the end of the input
+        """
+
+        for line in lines:
+            if not self.handle(line):
+                return
+
+        self.wait()
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the engine over the '
+                                     'Universal Chess Interface on stdin and '
+                                     'stdout')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to search with')
+    parser.add_argument('--book', default=None,
+                        help='Polyglot opening book to play from before '
+                        'searching')
+    parser.add_argument('--tablebases', default=None,
+                        help='directory of tables written by tablebase.py')
+    args = parser.parse_args()
+
+    UciEngine(workers=args.workers, book_path=args.book,
+              tablebase_path=args.tablebases).run()
@@ -0,0 +1,382 @@
+import copy
+import os
+import math
+import threading
+
+import pygame
+
+from typing import Dict, List, Tuple, Union
+
+from chess import ChessGame, get_row, get_file
+from compact import CompactPosition
+from pieces import Piece, BlankPiece, King
+from search import Searcher, TranspositionTable
+
+# Posted by the engine thread with the move it found, see start_engine
+ENGINE_MOVE = pygame.event.custom_type()
+
+# Piece.sprite_path of each CompactPosition piece code
+code_sprite_paths = [None] + [color + name + '.png'
+                              for color in ['White', 'Black']
+                              for name in ['Pawn', 'Knight', 'Bishop', 'Rook',
+                                           'Queen', 'King']]
+
+
+class SpriteAtlas:
+    """
+    Piece sprites of res/, each image is read from disk once and scaled once
+    for every square size it is drawn at
+    """
+
+    images: Dict[str, pygame.Surface]  # Unscaled sprite for each Piece.sprite_path
+    _scaled: Dict[Tuple[str, int], pygame.Surface]  # Scaled sprites by sprite path and size
+
+    def __init__(self, directory: str='res') -> None:
+        """
+        Constructor for the SpriteAtlas class, the display has to be set up
+        before so the images can be converted to its pixel format
+
+        directory:str -> folder holding the twelve piece images
+        """
+
+        self.images = {}
+        self._scaled = {}
+
+        for color in ['White', 'Black']:
+            for name in ['Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King']:
+                sprite_path = color + name + '.png'
+                self.images[sprite_path] = pygame.image.load(
+                    os.path.join(directory, sprite_path)).convert_alpha()
+
+    def get(self, sprite_path: str, size: int) -> pygame.Surface:
+        """
+        Returns a sprite scaled to size x size pixels
+        """
+
+        key = (sprite_path, size)
+        sprite = self._scaled.get(key)
+
+        if sprite is None:
+            sprite = pygame.transform.scale(self.images[sprite_path],
+                                            (size, size))
+            self._scaled[key] = sprite
+
+        return sprite
+
+    def invalidate(self) -> None:
+        """
+        Drops every scaled sprite, called when the square size changes
+        """
+
+        self._scaled.clear()
+
+
+class WindowManager:
+    """
+    Class to manage all the rendering displaying and user input
+    """
+
+    win_width: int 
+    win_height: int 
+
+    window: pygame.Surface
+
+    square_size: float  # The width/height of across for each tile of the board
+
+    board_rects: List[pygame.Rect]  # List holding colored squares representing the chess board
+    background: pygame.Surface  # The empty board, drawn once and copied from
+
+    # Squares drawn with the highlight surface on top.
+    # Surface used instead of Rect for transparancy
+    highlight_squares: List[int]
+    highlight_surface: pygame.Surface
+    highlight_alpha: int  # defines how transparent highlighted squares are
+
+    dirty_rects: bool  # Only redraw and update squares that changed since the last frame
+
+    engine_color: int  # color_val the engine plays, 0 if it does not play
+    engine_time: float  # Seconds the engine thinks for each move
+    engine_table: TranspositionTable  # Kept between the moves of the engine
+    _engine_thread: threading.Thread  # Thread searching for a move, None while not thinking
+    _drawn: List[tuple]  # (sprite path, highlighted) of each square on screen, None to redraw it
+
+    atlas: SpriteAtlas  # Piece sprites scaled to square_size
+
+    _light_color: pygame.Color 
+    _dark_color: pygame.Color
+    _highlight_color: pygame.Color   
+
+    def __init__(self, window_width: int, window_height: int, name: str="Chess",
+                 dirty_rects: bool=True, engine_color: int=0,
+                 engine_time: float=1.0) -> None:
+        """
+        Window Manager constructor
+
+        dirty_rects:bool -> only redraw the squares that changed, otherwise
+                            the whole window is drawn every frame
+        engine_color:int -> color_val the engine plays, 0 for none
+        engine_time:float -> seconds the engine thinks for each move
+        """
+        
+        pygame.init()
+
+
+        self.window = pygame.display.set_mode((window_width, window_height),
+                                              pygame.RESIZABLE)
+
+        pygame.display.set_caption(name)
+
+        self.atlas = SpriteAtlas()
+
+        self.highlight_squares = []
+        self.highlight_alpha = 77  # 77 -> 50% transparancy
+
+        # Colors
+        self._light_color = pygame.Color(240, 240, 240)
+        self._dark_color = pygame.Color(46, 139, 87)
+        self._highlight_color = pygame.Color(255, 0, 0)
+
+        self.dirty_rects = dirty_rects
+
+        self.engine_color = engine_color
+        self.engine_time = engine_time
+        self.engine_table = TranspositionTable()
+        self._engine_thread = None
+
+        # Only events that change what is shown wake up poll_events
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONUP,
+                                  pygame.KEYUP, pygame.WINDOWEXPOSED,
+                                  pygame.VIDEORESIZE, ENGINE_MOVE])
+
+        self.resize(window_width, window_height)
+
+    def resize(self, window_width: int, window_height: int) -> None:
+        """
+        Lays the board out for a new window size, the board fills the
+        shorter side
+        """
+
+        self.win_width = window_width
+        self.win_height = window_height
+
+        self.square_size = min(self.win_width, self.win_height) / 8
+
+        self.board_rects = []
+
+        # Initializing the board_rects array
+        for i in range(64):
+            row = math.floor(i / 8)
+            file = i % 8
+
+            self.board_rects.append(pygame.Rect(file * self.square_size, row
+                                                * self.square_size,
+                                                self.square_size,
+                                                self.square_size))
+
+        # Sprites of the old size are not drawn anymore
+        self.atlas.invalidate()
+
+        self.render_background()
+
+    def render_background(self) -> None:
+        """
+        Draws the empty board and the highlight surface once, every frame
+        copies from them instead of drawing the squares again
+        """
+
+        self.background = pygame.Surface((self.win_width, self.win_height))
+
+        for i, rect in enumerate(self.board_rects):
+            color = (self._light_color if (get_file(i) + get_row(i))
+                     % 2 == 0 else self._dark_color)
+            pygame.draw.rect(self.background, color, rect)
+
+        self.highlight_surface = pygame.Surface((self.square_size,
+                                                 self.square_size))
+        self.highlight_surface.set_alpha(self.highlight_alpha)  # Adding transparancy
+        self.highlight_surface.fill(self._highlight_color)
+
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Makes the next render_window draw the whole window
+        """
+
+        self._drawn = [None] * 64
+
+    def highlight_legal_moves(self, selected_piece: Piece) -> None:
+        """
+        Highlights all tiles a selected piece can move to
+        """
+
+        moves:List[int] = selected_piece.moves
+
+        if type(selected_piece) == King:
+            moves += selected_piece.castle_moves
+
+        self.highlight_squares = list(moves)
+
+    def start_engine(self, curr_game: ChessGame) -> None:
+        """
+        Starts searching for a move on a worker thread, the move is posted
+        back as an ENGINE_MOVE event so the window stays responsive
+
+        The search runs on a copy of the game, the board being drawn is
+        never touched by it
+        """
+
+        game = copy.deepcopy(curr_game)
+        ply = len(curr_game.history)
+
+        def think() -> None:
+            result = Searcher(game, self.engine_table).search(
+                time_limit=self.engine_time)
+
+            # Posted even without a move so the window knows it finished
+            pygame.event.post(pygame.event.Event(
+                ENGINE_MOVE, move=result.best_move, ply=ply))
+
+        self._engine_thread = threading.Thread(target=think, daemon=True)
+        self._engine_thread.start()
+
+    @property
+    def engine_thinking(self) -> bool:
+        """
+        Returns a bool if the engine thread is still searching
+        """
+
+        return self._engine_thread is not None and self._engine_thread.is_alive()
+
+    def poll_events(self, curr_game: ChessGame, timeout: int=0) -> None:
+        """
+        Takes input from the user
+
+        Waits up to timeout milliseconds for an event when there is none, 0
+        waits until one arrives. Starts the engine when it is its turn
+        """
+
+        # A finished game has nothing to search, the engine would only post
+        # move 0 and be started again
+        if (self.engine_color == curr_game.current_color
+                and self._engine_thread is None
+                and curr_game.legal_moves()):
+            self.start_engine(curr_game)
+
+        # Sleeping until something happens instead of spinning
+        events = [pygame.event.wait(timeout)] + pygame.event.get()
+
+        for event in events:
+            
+            # Quitting the window
+            if event.type == pygame.QUIT:
+                curr_game.running = False
+
+            # Window uncovered, everything has to be drawn again
+            if event.type == pygame.WINDOWEXPOSED:
+                self.invalidate()
+
+            if event.type == pygame.VIDEORESIZE:
+                self.resize(event.w, event.h)
+
+            # Move found by the engine thread, dropped if the game moved on
+            if event.type == ENGINE_MOVE:
+                self._engine_thread = None
+
+                if event.move and event.ply == len(curr_game.history):
+                    curr_game.make_move(event.move)
+                    curr_game.update_new_position()
+
+                    curr_game.selected_piece = BlankPiece(-1)
+                    self.highlight_squares.clear()
+
+            # The board is the engine's while it is thinking
+            if self.engine_thinking:
+                continue
+
+            # Mouse input
+            if event.type == pygame.MOUSEBUTTONUP:
+                
+                # Getting position of the mouse
+                x, y = pygame.mouse.get_pos()
+                row = math.floor(y / self.square_size)
+                file = math.floor(x / self.square_size)
+                pos = row * 8 + file
+
+                # Clicks beside the board of a window that is not square
+                if row > 7 or file > 7:
+                    continue
+
+                # Selecting where to move a piece (2nd click)
+                if pos in curr_game.selected_piece.moves:
+                    curr_game.move(curr_game.selected_piece.pos, pos)
+                    curr_game.update_new_position()
+
+                    self.highlight_squares.clear()
+                # Selecting a piece
+                elif curr_game.board[pos].color_val == curr_game.current_color:
+                    curr_game.selected_piece = curr_game.board[pos]
+                    self.highlight_legal_moves(curr_game.selected_piece)
+                else:
+                    curr_game.selected_piece = BlankPiece(-1)
+                    self.highlight_squares.clear()
+            
+            # Keyboard input
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_u:
+                    curr_game.undo_move()
+
+                    # Taking back the reply of the engine as well, it would
+                    # just play it again
+                    if (self.engine_color == curr_game.current_color
+                            and curr_game.history):
+                        curr_game.undo_move()
+
+    def render_window(self, chess_board: Union[List[Piece],
+                                               CompactPosition]) -> None:
+        """
+        Function containing code to render to the pygame window, either a
+        ChessGame.board or a CompactPosition can be drawn
+
+        With dirty_rects only squares whose piece or highlight changed since
+        the last frame are drawn and updated, frames where nothing changed
+        draw nothing
+        """
+
+        if isinstance(chess_board, CompactPosition):
+            sprite_paths = [code_sprite_paths[code]
+                            for code in chess_board.squares]
+        else:
+            sprite_paths = [piece.sprite_path if piece.index != -1 else None
+                            for piece in chess_board]
+
+        highlighted = set(self.highlight_squares)
+        dirty = []
+
+        for i, sprite_path in enumerate(sprite_paths):
+            state = (sprite_path, i in highlighted)
+
+            if self.dirty_rects and state == self._drawn[i]:
+                continue
+
+            self._drawn[i] = state
+            rect = self.board_rects[i]
+
+            # Copying the empty square back from the background
+            self.window.blit(self.background, rect, rect)
+
+            # Highlighting squares
+            if state[1]:
+                self.window.blit(self.highlight_surface, rect)
+
+            # Drawing the chess piece on the square
+            if state[0] is not None:
+                self.window.blit(self.atlas.get(state[0], rect.width), rect)
+
+            dirty.append(rect)
+
+        if not self.dirty_rects:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
@@ -0,0 +1,33 @@
+import random
+
+from typing import List
+
+# Seeded so every process (and every run) hashes positions to the same keys
+_generator = random.Random(20240601)
+
+def _random_key() -> int:
+    """
+    Returns a random 64-bit key
+    """
+
+    return _generator.getrandbits(64)
+
+# Key for every piece index (color * 6 + piece type) on every square
+piece_keys: List[List[int]] = [[_random_key() for pos in range(64)]
+                               for piece in range(12)]
+
+side_key = _random_key()  # Toggled in when black is to move
+
+# Key for each combination of the four castling rights bits
+_castling_right_keys = [_random_key() for right in range(4)]
+castling_keys: List[int] = []
+
+for rights in range(16):
+    key = 0
+    for right in range(4):
+        if rights & (1 << right):
+            key ^= _castling_right_keys[right]
+    castling_keys.append(key)
+
+# Key for the file of an en passant square
+en_passant_keys: List[int] = [_random_key() for file in range(8)]